@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from .main import (rgb_to_yuv, rgb_to_yuv_frame, yuv_to_rgb_frame, DCTConverter, read_image_serpentine,
+                  run_length_encode, run_length_decode)
+
+# name -> (width, height)
+RESOLUTIONS = {
+    '120p': (160, 120),
+    '240p': (320, 240),
+    '480p': (640, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '4k': (3840, 2160),
+}
+
+# Where the baseline is kept, next to the probe cache (the package directory may be read-only
+# once installed). Override with the VIDEO_BENCHMARK_BASELINE environment variable or --baseline
+DEFAULT_BASELINE = os.environ.get(
+    'VIDEO_BENCHMARK_BASELINE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'codificacio_video', 'benchmark_baseline.json'))
+# slower than the baseline by more than this fraction = regression
+DEFAULT_THRESHOLD = 0.15
+# the per-pixel loops are only timed on this many pixels, they would take minutes on a 4K frame
+SCALAR_PIXELS = 20000
+
+def synthetic_frame(width, height, seed=0):
+    """
+    RGB test frame: smooth gradients plus noise, so RLE and DCT see something
+    closer to real content than pure noise.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    frame = np.stack([x * 255 / max(width - 1, 1), y * 255 / max(height - 1, 1), (x + y) % 256], axis=-1)
+    frame += rng.normal(0, 4, frame.shape)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+def measure(func, repeat):
+    """
+    Best wall time of func over repeat runs, and its peak traced memory.
+
+    Returns:
+        tuple: (seconds, peak bytes).
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    # separate run for memory, tracemalloc slows everything down
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+def _cases(width, height, workdir):
+    """
+    (name, pixels processed, callable) for every primitive at one resolution.
+    """
+    frame = synthetic_frame(width, height)
+    yuv = rgb_to_yuv_frame(frame)
+    luma = yuv[..., 0].copy()
+    coefficients = DCTConverter(batched=True).encode(luma)
+    luma_bytes = luma.astype(np.uint8)
+    # quantize a bit so RLE has runs to find, like after a real transform
+    rle_input = (luma_bytes // 16).tobytes()
+    rle_encoded = run_length_encode(rle_input)
+    raw_path = os.path.join(workdir, f'{width}x{height}.raw')
+    luma_bytes.tofile(raw_path)
+
+    scalar_pixels = frame.reshape(-1, 3)[:SCALAR_PIXELS].tolist()
+    pixels = width * height
+    batched = DCTConverter(batched=True)
+    batched_float32 = DCTConverter(batched=True, dtype=np.float32)
+
+    cases = [
+        ('rgb_to_yuv (scalar)', len(scalar_pixels), lambda: [rgb_to_yuv(p) for p in scalar_pixels]),
+        ('rgb_to_yuv_frame', pixels, lambda: rgb_to_yuv_frame(frame)),
+        ('rgb_to_yuv_frame (fixed point)', pixels, lambda: rgb_to_yuv_frame(frame, fixed_point=True)),
+        ('yuv_to_rgb_frame', pixels, lambda: yuv_to_rgb_frame(yuv)),
+        ('DCTConverter.encode (batched)', pixels, lambda: batched.encode(luma)),
+        ('DCTConverter.encode (batched, float32)', pixels, lambda: batched_float32.encode(luma)),
+        ('DCTConverter.decode (batched)', pixels, lambda: batched.decode(coefficients)),
+        ('read_image_serpentine', pixels, lambda: read_image_serpentine(raw_path, width, height)),
+        ('run_length_encode', pixels, lambda: run_length_encode(rle_input)),
+        ('run_length_decode', pixels, lambda: run_length_decode(rle_encoded)),
+    ]
+    if pixels <= 640 * 480:
+        # the block-by-block loop, only where it finishes in reasonable time
+        looped = DCTConverter()
+        cases.append(('DCTConverter.encode (loop)', pixels, lambda: looped.encode(luma)))
+    return cases
+
+def run_benchmarks(resolutions=None, repeat=5):
+    """
+    Time every primitive on synthetic frames.
+
+    Args:
+        resolutions (list, optional): Keys of RESOLUTIONS. Defaults to all of them.
+        repeat (int): Runs per measurement, the best one is kept.
+
+    Returns:
+        dict: "primitive @ resolution" -> {'mpix_per_s', 'seconds', 'peak_mb'}.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in resolutions or RESOLUTIONS:
+            width, height = RESOLUTIONS[name]
+            for case, pixels, func in _cases(width, height, workdir):
+                seconds, peak = measure(func, repeat)
+                results[f'{case} @ {name}'] = {
+                    'mpix_per_s': pixels / seconds / 1e6,
+                    'seconds': seconds,
+                    'peak_mb': peak / 2 ** 20,
+                }
+    return results
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Find the measurements whose throughput dropped more than threshold below the baseline.
+
+    Returns:
+        list: (key, baseline MP/s, current MP/s) of every regression.
+    """
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if reference and result['mpix_per_s'] < reference['mpix_per_s'] * (1 - threshold):
+            regressions.append((key, reference['mpix_per_s'], result['mpix_per_s']))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the P1 signal-processing primitives")
+    parser.add_argument('--resolutions', nargs='+', choices=list(RESOLUTIONS), help="Resolutions to run (default: all)")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per measurement, the best is kept")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline JSON file (default: %(default)s)")
+    parser.add_argument('--save-baseline', action='store_true', help="Store this run as the new baseline")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown before flagging a regression (0.15 = 15%%)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.resolutions, args.repeat)
+    for key, result in results.items():
+        print(f"{key:<55} {result['mpix_per_s']:>10.2f} MP/s {result['peak_mb']:>9.1f} MB peak")
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f).get('results', {})
+        # keep the resolutions that were not run this time
+        baseline.update(results)
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({'machine': platform.platform(), 'python': platform.python_version(),
+                       'numpy': np.__version__, 'results': baseline}, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare with, run with --save-baseline first")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.threshold)
+    for key, before, now in regressions:
+        print(f"REGRESSION {key}: {before:.2f} -> {now:.2f} MP/s ({now / before - 1:+.0%})")
+    if not regressions:
+        print(f"No regressions above {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+import argparse
+import subprocess
+import sys
+
+from .jobs import Telemetry, set_default_telemetry
+
+# Every command imports what it needs when it runs, so starting the CLI
+# (e.g. a short job of a queue worker) never loads NumPy, SciPy or PyAV for nothing.
+# Commands return the exit status: 0 only if everything was written.
+
+def _probe(args):
+    from .probe import probe, ProbeError
+
+    status = 0
+    for path in args.files:
+        try:
+            info = probe(path)
+        except (ProbeError, OSError) as e:
+            print(f"{path}: {e}", file=sys.stderr)
+            status = 1
+            continue
+        print(f"{path}: {info.format.format_name}, {info.duration} s, tracks {info.track_counts()}")
+        for stream in info.streams:
+            size = f" {stream.width}x{stream.height}" if stream.width else ''
+            print(f"  #{stream.index} {stream.codec_type} {stream.codec_name}{size}")
+    return status
+
+def _resize(args):
+    from P2_video.main import change_resolution
+
+    return 0 if change_resolution(args.input, args.output, args.width, args.height) else 1
+
+def _chroma(args):
+    from P2_video.main import change_chroma_subsampling
+
+    return 0 if change_chroma_subsampling(args.input, args.output) else 1
+
+def _convert(args):
+    from SP3.SP3_video.main import VideoConverter
+
+    converter = VideoConverter(args.input)
+    return 0 if getattr(converter, f'convert_to_{args.codec}')(args.output, chunked=args.chunked) else 1
+
+def _histogram(args):
+    from S2_video.exercise6 import yuv_histograms, save_yuv_histograms, render_yuv_histogram
+
+    if not (args.data or args.render):
+        raise ValueError("nothing to do, give --data and/or --render")
+    # the steps of extract_yuv_histogram, without its catch-all, so failures reach the exit status
+    if args.data:
+        save_yuv_histograms(yuv_histograms(args.input, args.every, args.window), args.data, args.every, args.window)
+    if args.render:
+        render_yuv_histogram(args.input, args.render)
+    return 0
+
+def _motion(args):
+    from S2_video.main import VideoEditor
+
+    if not (args.data or args.render):
+        raise ValueError("nothing to do, give --data and/or --render")
+    editor = VideoEditor(args.input, args.render) if args.render else VideoEditor(args.input)
+    return 0 if editor.analyze_frames(data_file=args.data, render=args.render is not None) else 1
+
+def _benchmark(args):
+    from .benchmark import main as benchmark_main
+
+    return benchmark_main(args.options)
+
+def _rd_benchmark(args):
+    from SP3.SP3_video.benchmark import main as rd_benchmark_main
+
+    return rd_benchmark_main(args.options)
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='codificacio-video', description="Video coding tools on top of ffmpeg")
+    parser.add_argument('--telemetry', metavar='FILE', help="Write progress and timing events of every job as JSON lines")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('probe', help="Show the streams of media files")
+    command.add_argument('files', nargs='+')
+    command.set_defaults(func=_probe)
+
+    command = commands.add_parser('resize', help="Change the resolution of a video")
+    command.add_argument('input')
+    command.add_argument('output')
+    command.add_argument('width', type=int)
+    command.add_argument('height', type=int)
+    command.set_defaults(func=_resize)
+
+    command = commands.add_parser('chroma', help="Re-encode a video with 4:2:2 chroma subsampling")
+    command.add_argument('input')
+    command.add_argument('output')
+    command.set_defaults(func=_chroma)
+
+    command = commands.add_parser('convert', help="Convert a video to VP8, VP9, H.265 or AV1")
+    command.add_argument('input')
+    command.add_argument('output')
+    command.add_argument('--codec', choices=['vp8', 'vp9', 'h265', 'av1'], required=True)
+    command.add_argument('--chunked', action='store_true', help="Encode keyframe-aligned pieces in parallel")
+    command.set_defaults(func=_convert)
+
+    command = commands.add_parser('histogram', help="YUV histograms of a video")
+    command.add_argument('input')
+    command.add_argument('--data', metavar='NPZ', help="Save the histograms as arrays")
+    command.add_argument('--render', metavar='VIDEO', help="Also draw them over the video (full encode)")
+    command.add_argument('--every', type=int, default=1, help="Only use every Nth frame")
+    command.add_argument('--window', type=int, default=1, help="Sampled frames per histogram")
+    command.set_defaults(func=_histogram)
+
+    command = commands.add_parser('motion', help="Motion vectors of a video")
+    command.add_argument('input')
+    command.add_argument('--data', metavar='NPZ', help="Save the vectors and per frame statistics as arrays")
+    command.add_argument('--render', metavar='VIDEO', help="Also draw them over the video (full encode)")
+    command.set_defaults(func=_motion)
+
+    # every option after 'benchmark' / 'rd-benchmark' goes to their own parser as is
+    command = commands.add_parser('benchmark', add_help=False,
+                                  help="Micro-benchmarks of the P1 primitives (options as in P1_video.benchmark)")
+    command.set_defaults(func=_benchmark)
+
+    command = commands.add_parser('rd-benchmark', add_help=False,
+                                  help="Rate-distortion and speed sweep of the codecs (options as in SP3.SP3_video.benchmark)")
+    command.set_defaults(func=_rd_benchmark)
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args, options = parser.parse_known_args(argv)
+    if options and args.command not in ('benchmark', 'rd-benchmark'):
+        parser.error(f"unrecognized arguments: {' '.join(options)}")
+    args.options = options
+    if args.telemetry:
+        set_default_telemetry(Telemetry(jsonl_path=args.telemetry))
+    try:
+        return args.func(args)
+    except (subprocess.CalledProcessError, OSError, ValueError) as e:
+        print(f"{args.command}: {e}", file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,295 @@
+import struct
+from functools import lru_cache
+import numpy as np
+from .main import (rgb_to_yuv_frame, yuv_to_rgb_frame, DCTConverter, frame_to_blocks,
+                  zigzag_scan, inverse_zigzag_scan, run_length_encode, run_length_decode)
+from .huffman import HuffmanTable, huffman_encode, huffman_decode
+
+# Standard JPEG (Annex K) quantization tables, quality 50
+LUMA_QUANT_TABLE = np.array([
+    [16, 11, 10, 16, 24, 40, 51, 61],
+    [12, 12, 14, 19, 26, 58, 60, 55],
+    [14, 13, 16, 24, 40, 57, 69, 56],
+    [14, 17, 22, 29, 51, 87, 80, 62],
+    [18, 22, 37, 56, 68, 109, 103, 77],
+    [24, 35, 55, 64, 81, 104, 113, 92],
+    [49, 64, 78, 87, 103, 121, 120, 101],
+    [72, 92, 95, 98, 112, 100, 103, 99]], dtype=np.float32)
+CHROMA_QUANT_TABLE = np.array([
+    [17, 18, 24, 47, 99, 99, 99, 99],
+    [18, 21, 26, 66, 99, 99, 99, 99],
+    [24, 26, 56, 99, 99, 99, 99, 99],
+    [47, 66, 99, 99, 99, 99, 99, 99],
+    [99, 99, 99, 99, 99, 99, 99, 99],
+    [99, 99, 99, 99, 99, 99, 99, 99],
+    [99, 99, 99, 99, 99, 99, 99, 99],
+    [99, 99, 99, 99, 99, 99, 99, 99]], dtype=np.float32)
+
+# magic, version, quality, block size, flags, frames, height, width
+HEADER_FORMAT = '<4sBBBBIII'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAGIC = b'P1IC'
+VERSION = 1
+FLAG_SINGLE_FRAME = 1
+FLAG_HUFFMAN = 2
+# Huffman tables are over the RLE output bytes and stored right after the header
+HUFFMAN_SYMBOLS = 256
+# every section (one byte plane of one Y/U/V plane of one frame) starts with its length
+SECTION_FORMAT = '<I'
+SECTION_SIZE = struct.calcsize(SECTION_FORMAT)
+
+def huffman_table_for_sections(sections):
+    """
+    Huffman table fitted to the byte frequencies of some RLE sections. Every
+    bitstream stores its own, so the table always matches what it codes.
+    """
+    frequencies = np.zeros(HUFFMAN_SYMBOLS, dtype=np.int64)
+    for section in sections:
+        frequencies += np.bincount(np.frombuffer(section, dtype=np.uint8), minlength=HUFFMAN_SYMBOLS)
+    return HuffmanTable.from_frequencies(frequencies)
+
+@lru_cache(maxsize=32)
+def quantization_tables(quality=50):
+    """
+    Scale the JPEG quantization tables to a quality setting (IJG formula).
+
+    Args:
+        quality (int): 1 (smallest output) to 100 (best quality).
+
+    Returns:
+        tuple: (luma, chroma) 8x8 float32 tables, read-only and cached per quality.
+    """
+    if not 1 <= quality <= 100:
+        raise ValueError(f"Quality must be between 1 and 100, got {quality}")
+    scale = 5000 / quality if quality < 50 else 200 - 2 * quality
+
+    tables = []
+    for base in (LUMA_QUANT_TABLE, CHROMA_QUANT_TABLE):
+        table = np.clip(np.floor((base * scale + 50) / 100), 1, 255).astype(np.float32)
+        table.flags.writeable = False
+        tables.append(table)
+    return tuple(tables)
+
+def subsample_420(plane, out=None):
+    """
+    Average every 2x2 block of a (..., H, W) plane, padding odd sizes with the edge.
+
+    Returns:
+        np.array: Plane with shape (..., ceil(H / 2), ceil(W / 2)).
+    """
+    blocks = frame_to_blocks(plane, 2)
+    return np.mean(blocks, axis=(-2, -1), out=out)
+
+def upsample_420(plane, height, width, out=None):
+    """
+    Undo subsample_420 by repeating every sample 2x2 and cropping to height x width.
+    """
+    upsampled = np.repeat(np.repeat(plane, 2, axis=-2), 2, axis=-1)[..., :height, :width]
+    if out is None:
+        return upsampled
+    out[...] = upsampled
+    return out
+
+class IntraFrameCodec:
+    """
+    Intra-frame codec chaining the P1 primitives: RGB -> YUV, 4:2:0 chroma,
+    block DCT, quantization, zigzag and RLE (optionally followed by Huffman
+    coding), packed into a small bitstream.
+
+    The Huffman table is fitted to every encoded stream and stored in it. It
+    costs HUFFMAN_SYMBOLS bytes plus a symbol count per section, so a stream
+    that would not get smaller (e.g. a small, smooth frame) is written without it.
+    """
+
+    def __init__(self, quality=50, block_size=8, huffman=False):
+        if block_size != LUMA_QUANT_TABLE.shape[0]:
+            raise ValueError("The quantization tables are 8x8, block_size must be 8")
+        self.quality = quality
+        self.block_size = block_size
+        self.huffman = huffman
+        self.dct = DCTConverter(block_size, batched=True, dtype=np.float32)
+        self.luma_table, self.chroma_table = quantization_tables(quality)
+        self._buffers = {}
+
+    def _buffer(self, name, shape, dtype):
+        # intermediate buffers are kept between calls, so encoding frames of the
+        # same size over and over does not allocate them again
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buffer
+        return buffer
+
+    def _encode_plane(self, plane, table):
+        # quantized coefficients with shape (frames, blocks, 64) in zigzag order
+        coefficients = self.dct.encode_blocks(plane)
+        coefficients /= table
+        quantized = np.rint(coefficients).astype('<i2')  # little endian: low byte first
+        quantized = zigzag_scan(quantized)
+        return quantized.reshape(quantized.shape[0], -1, self.block_size ** 2)
+
+    def _decode_plane(self, quantized, table, blocks_h, blocks_w, height, width):
+        blocks = inverse_zigzag_scan(quantized, self.block_size).astype(np.float32)
+        blocks = blocks.reshape((blocks.shape[0], blocks_h, blocks_w, self.block_size, self.block_size))
+        blocks *= table
+        return self.dct.decode_blocks(blocks, height, width)
+
+    def encode(self, frames):
+        """
+        Encode RGB frames.
+
+        Args:
+            frames (np.array): uint8 RGB frame (H, W, 3) or stack of frames (N, H, W, 3).
+
+        Returns:
+            bytes: Encoded bitstream.
+        """
+        frames = np.asarray(frames)
+        single = frames.ndim == 3
+        if single:
+            frames = frames[np.newaxis]
+        n_frames, height, width = frames.shape[:3]
+
+        yuv = rgb_to_yuv_frame(frames, out=self._buffer('yuv', frames.shape, np.float32))
+        # planar views (N, H, W) of the interleaved buffer
+        y = yuv[..., 0]
+        y -= 128  # level shift so the DC coefficients are centered on 0
+        chroma_shape = (n_frames, (height + 1) // 2, (width + 1) // 2)
+        u = subsample_420(yuv[..., 1], out=self._buffer('u', chroma_shape, np.float32))
+        v = subsample_420(yuv[..., 2], out=self._buffer('v', chroma_shape, np.float32))
+
+        planes = [self._encode_plane(y, self.luma_table),
+                  self._encode_plane(u, self.chroma_table),
+                  self._encode_plane(v, self.chroma_table)]
+
+        sections = []
+        for f in range(n_frames):
+            for plane in planes:
+                # coefficient-major order: the high frequencies of all the blocks are
+                # mostly 0 and end up next to each other, which is what RLE is good at
+                coefficients = np.ascontiguousarray(plane[f].T)
+                as_bytes = coefficients.view(np.uint8).reshape(-1, 2)
+                for byte_plane in (as_bytes[:, 0], as_bytes[:, 1]):
+                    sections.append(run_length_encode(np.ascontiguousarray(byte_plane)))
+
+        flags = FLAG_SINGLE_FRAME if single else 0
+        table = None
+        if self.huffman:
+            table = huffman_table_for_sections(sections)
+            # huffman sections start with their number of symbols
+            coded = [struct.pack(SECTION_FORMAT, len(section)) + huffman_encode(
+                np.frombuffer(section, dtype=np.uint8), table) for section in sections]
+            if HUFFMAN_SYMBOLS + sum(map(len, coded)) < sum(map(len, sections)):
+                flags |= FLAG_HUFFMAN
+                sections = coded
+            else:
+                table = None
+
+        stream = bytearray(struct.pack(HEADER_FORMAT, MAGIC, VERSION, self.quality, self.block_size,
+                                       flags, n_frames, height, width))
+        if table is not None:
+            stream += table.to_bytes()
+
+        for section in sections:
+            stream += struct.pack(SECTION_FORMAT, len(section))
+            stream += section
+        return bytes(stream)
+
+    def decode(self, bitstream):
+        """
+        Decode a bitstream produced by encode.
+
+        Args:
+            bitstream (bytes): Encoded bitstream.
+
+        Returns:
+            np.array: uint8 RGB frame (H, W, 3) or stack of frames (N, H, W, 3).
+        """
+        header, sections = _read_sections(bitstream)
+        magic, version, quality, block_size, flags, n_frames, height, width = header
+        if flags & FLAG_HUFFMAN:
+            table = HuffmanTable.from_bytes(bitstream[HEADER_SIZE:HEADER_SIZE + HUFFMAN_SYMBOLS])
+            sections = (_huffman_section(section, table) for section in sections)
+        if quality != self.quality or block_size != self.block_size:
+            raise ValueError(f"Bitstream was encoded with quality {quality}, block size {block_size}")
+
+        chroma_h, chroma_w = (height + 1) // 2, (width + 1) // 2
+        plane_sizes = [(height, width), (chroma_h, chroma_w), (chroma_h, chroma_w)]
+        tables = [self.luma_table, self.chroma_table, self.chroma_table]
+        block_counts = [(-(-h // block_size), -(-w // block_size)) for h, w in plane_sizes]
+
+        quantized = [np.empty((n_frames, bh * bw, block_size ** 2), dtype=np.int16) for bh, bw in block_counts]
+        for f in range(n_frames):
+            for p in range(3):
+                low = np.frombuffer(run_length_decode(next(sections)), dtype=np.uint8)
+                high = np.frombuffer(run_length_decode(next(sections)), dtype=np.uint8)
+                coefficients = np.empty((low.size, 2), dtype=np.uint8)
+                coefficients[:, 0] = low
+                coefficients[:, 1] = high
+                quantized[p][f] = coefficients.view('<i2').reshape(block_size ** 2, -1).T
+
+        yuv = self._buffer('yuv', (n_frames, height, width, 3), np.float32)
+        for p in range(3):
+            (bh, bw), (h, w) = block_counts[p], plane_sizes[p]
+            plane = self._decode_plane(quantized[p], tables[p], bh, bw, h, w)
+            if p == 0:
+                yuv[..., 0] = plane + 128
+            else:
+                upsample_420(plane, height, width, out=yuv[..., p])
+
+        rgb = yuv_to_rgb_frame(yuv)
+        return rgb[0] if flags & FLAG_SINGLE_FRAME else rgb
+
+def _read_sections(bitstream):
+    # parse the header and give back a generator over the sections
+    header = struct.unpack_from(HEADER_FORMAT, bitstream)
+    if header[0] != MAGIC or header[1] != VERSION:
+        raise ValueError("Not a P1 intra-frame bitstream")
+
+    def sections():
+        offset = HEADER_SIZE + (HUFFMAN_SYMBOLS if header[4] & FLAG_HUFFMAN else 0)
+        while offset < len(bitstream):
+            (length,) = struct.unpack_from(SECTION_FORMAT, bitstream, offset)
+            offset += SECTION_SIZE
+            yield bitstream[offset:offset + length]
+            offset += length
+
+    return header, sections()
+
+def _huffman_section(section, table):
+    # undo the Huffman stage of a section, giving back the RLE bytes
+    (n_symbols,) = struct.unpack_from(SECTION_FORMAT, section)
+    return huffman_decode(section[SECTION_SIZE:], n_symbols, table).astype(np.uint8).tobytes()
+
+def frame_costs(bitstream):
+    """
+    Bytes spent on every frame of a bitstream (headers excluded).
+
+    Args:
+        bitstream (bytes): Bitstream produced by IntraFrameCodec.encode.
+
+    Returns:
+        list: Encoded size of each frame in bytes.
+    """
+    header, sections = _read_sections(bitstream)
+    n_frames = header[5]
+    # 3 planes x 2 byte planes per frame
+    per_frame = 6
+    costs = [0] * n_frames
+    for i, section in enumerate(sections):
+        costs[i // per_frame] += len(section) + SECTION_SIZE
+    return costs
+
+
+'''
+# Encode a random frame stack and check the cost per frame
+if __name__ == '__main__':
+    frames = np.random.randint(0, 256, (4, 120, 160, 3), dtype=np.uint8)
+    codec = IntraFrameCodec(quality=75, huffman=True)
+    bitstream = codec.encode(frames)
+    decoded = codec.decode(bitstream)
+
+    print("Raw size:", frames.nbytes, "Encoded size:", len(bitstream))
+    print("Bytes per frame:", frame_costs(bitstream))
+    print("Max error:", np.abs(decoded.astype(int) - frames).max())
+'''
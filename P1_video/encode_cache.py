@@ -0,0 +1,279 @@
+import contextlib
+import hashlib
+import os
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import time
+from functools import lru_cache
+
+from .jobs import run_command
+
+# Where encoded outputs are kept. Caching is off unless VIDEO_ENCODE_CACHE names a
+# directory or set_default_cache is called
+CACHE_ENV = 'VIDEO_ENCODE_CACHE'
+DEFAULT_MAX_BYTES = 20 * 2 ** 30
+
+# Options that change how ffmpeg talks, not what it writes: left out of the keys
+_QUIET_OPTIONS = {'-y', '-n', '-nostdin', '-nostats', '-hide_banner'}
+_QUIET_OPTIONS_WITH_VALUE = {'-v', '-loglevel', '-progress', '-stats_period'}
+
+def file_hash(path, chunk_size=1 << 20):
+    """
+    SHA-256 of a file's content, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+@lru_cache(maxsize=None)
+def ffmpeg_version(ffmpeg='ffmpeg'):
+    """
+    First line of `ffmpeg -version`, part of every key: a different build may encode differently.
+    """
+    result = run_command([ffmpeg, '-version'], capture_output=True, text=True, check=True)
+    return result.stdout.splitlines()[0].strip()
+
+def command_inputs(command):
+    """
+    Files read by an ffmpeg command (the -i arguments that are files).
+
+    Returns:
+        list: Paths, or None if an input is not a local file (URL, lavfi, pipe):
+        such commands cannot be cached.
+    """
+    inputs = []
+    for option, value in zip(command, command[1:]):
+        if option == '-i':
+            if not os.path.isfile(value):
+                return None
+            inputs.append(value)
+    return inputs
+
+class EncodeCache:
+    """
+    Outputs of ffmpeg commands, addressed by what produces them: the content of
+    the inputs, the normalized arguments and the ffmpeg version. Running the same
+    command on the same masters again copies the stored outputs instead.
+
+    Entries are indexed in SQLite with their size and SHA-256, written to the
+    store atomically (temporary file + rename) and checked before they are used.
+    The least recently used ones are evicted to stay under max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, verify=True):
+        """
+        Args:
+            directory (str): Where the outputs and the index live.
+            max_bytes (int): Size of the stored outputs before evicting.
+            verify (bool): Check the SHA-256 of an entry before using it, not only its size.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.verify = verify
+        os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS entries '
+                               '(key TEXT, output INTEGER, size INTEGER, sha256 TEXT, last_used REAL, '
+                               'PRIMARY KEY (key, output))')
+            # content hashes of the inputs, so unchanged masters are read only once
+            connection.execute('CREATE TABLE IF NOT EXISTS hashes '
+                               '(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha256 TEXT)')
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # one short connection per call and closed afterwards, like ProbeCache
+        connection = sqlite3.connect(os.path.join(self.directory, 'index.sqlite3'), timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _object_path(self, key, output):
+        return os.path.join(self.directory, 'objects', key[:2], f'{key}.{output}')
+
+    def input_hash(self, path):
+        """
+        Content hash of an input, recomputed only when its size or mtime changed.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._connect() as connection:
+            row = connection.execute('SELECT sha256 FROM hashes WHERE path = ? AND size = ? AND mtime_ns = ?',
+                                     (path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        if row:
+            return row[0]
+        digest = file_hash(path)
+        with self._connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)',
+                               (path, stat.st_size, stat.st_mtime_ns, digest))
+        return digest
+
+    def key(self, command, outputs):
+        """
+        Cache key of a command, or None if it cannot be cached.
+
+        Input paths are replaced by their content hash and output paths by their
+        position and extension (the muxer depends on it), so the same work on
+        files with other names gets the same key. Commands using the tee muxer
+        are not cached: their outputs are hidden inside one argument.
+        """
+        if _uses_tee(command):
+            return None
+        inputs = command_inputs(command)
+        if inputs is None:
+            return None
+        replacements = {path: f'<input {self.input_hash(path)}>' for path in inputs}
+        replacements.update({path: f'<output {i}{os.path.splitext(path)[1]}>' for i, path in enumerate(outputs)})
+
+        normalized, skip = [], False
+        for arg in command[1:]:
+            if skip:
+                skip = False
+            elif arg in _QUIET_OPTIONS_WITH_VALUE:
+                skip = True
+            elif arg not in _QUIET_OPTIONS:
+                normalized.append(replacements.get(arg, arg))
+        digest = hashlib.sha256(ffmpeg_version(command[0]).encode())
+        for arg in normalized:
+            digest.update(b'\0' + arg.encode())
+        return digest.hexdigest()
+
+    def get(self, key, outputs):
+        """
+        Copy the stored outputs of key to the given paths.
+
+        Returns:
+            bool: True on a hit. Entries that are missing or fail the check are dropped.
+        """
+        with self._connect() as connection:
+            rows = connection.execute('SELECT output, size, sha256 FROM entries WHERE key = ? ORDER BY output',
+                                      (key,)).fetchall()
+        if len(rows) != len(outputs):
+            return False
+        for output, size, sha256 in rows:
+            path = self._object_path(key, output)
+            try:
+                intact = os.path.getsize(path) == size and (not self.verify or file_hash(path) == sha256)
+            except OSError:
+                intact = False
+            if not intact:
+                self.remove(key)
+                return False
+
+        for (output, _, _), target in zip(rows, outputs):
+            _atomic_copy(self._object_path(key, output), target)
+        with self._connect() as connection:
+            connection.execute('UPDATE entries SET last_used = ? WHERE key = ?', (time.time(), key))
+        return True
+
+    def put(self, key, outputs):
+        """
+        Store the outputs of a command that just ran, then evict down to max_bytes.
+        """
+        entries = []
+        for output, source in enumerate(outputs):
+            path = self._object_path(key, output)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _atomic_copy(source, path)
+            entries.append((key, output, os.path.getsize(path), file_hash(path), time.time()))
+        with self._connect() as connection:
+            connection.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)', entries)
+        self.evict()
+
+    def remove(self, key):
+        with self._connect() as connection:
+            outputs = [row[0] for row in connection.execute('SELECT output FROM entries WHERE key = ?', (key,))]
+            connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+        for output in outputs:
+            try:
+                os.remove(self._object_path(key, output))
+            except FileNotFoundError:
+                pass
+
+    def evict(self):
+        """
+        Remove the least recently used commands until the store fits in max_bytes.
+        """
+        with self._connect() as connection:
+            total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            keys = connection.execute('SELECT key, SUM(size) FROM entries GROUP BY key '
+                                      'ORDER BY MAX(last_used)').fetchall()
+        for key, size in keys:
+            if total <= self.max_bytes:
+                break
+            self.remove(key)
+            total -= size
+
+def _uses_tee(command):
+    return any(option == '-f' and value == 'tee' for option, value in zip(command, command[1:]))
+
+def _atomic_copy(source, target):
+    # copy next to the target and rename, so nobody ever sees half a file
+    directory = os.path.dirname(os.path.abspath(target))
+    descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.encode_cache_')
+    os.close(descriptor)
+    try:
+        shutil.copyfile(source, temporary)
+        os.replace(temporary, target)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+_default_cache = EncodeCache(os.environ[CACHE_ENV]) if os.environ.get(CACHE_ENV) else None
+
+def set_default_cache(cache):
+    """
+    Cache used by the ffmpeg wrappers of the projects. None turns caching off.
+    """
+    global _default_cache
+    _default_cache = cache
+
+def get_default_cache():
+    return _default_cache
+
+def run_cached(command, outputs, cache=None, **kwargs):
+    """
+    run_command for commands whose only effect is writing outputs.
+
+    On a hit the outputs are copied from the cache and ffmpeg does not run. On a
+    miss the command runs as usual and, if it succeeded and wrote every output,
+    they are stored. Commands reading something that is not a local file or
+    writing through the tee muxer are never cached. With -n, existing outputs
+    are never overwritten: if one exists the command just runs, so ffmpeg
+    refuses as it would without the cache, and nothing is stored.
+
+    Args:
+        command (list): ffmpeg command.
+        outputs (list): Every file the command writes.
+        cache (EncodeCache, optional): Defaults to the default cache (none: just run).
+        **kwargs: Options of run_command (check, capture_output, ...).
+
+    Returns:
+        subprocess.CompletedProcess: The finished process (return code 0 on a hit).
+    """
+    cache = cache or _default_cache
+    if '-n' in command and any(os.path.exists(path) for path in outputs):
+        cache = None
+    key = cache.key(command, outputs) if cache else None
+    if key and cache.get(key, outputs):
+        empty = ('' if kwargs.get('text') else b'') if kwargs.get('capture_output') else None
+        return subprocess.CompletedProcess(command, 0, empty, empty)
+
+    result = run_command(command, **kwargs)
+    if key and result.returncode == 0 and all(os.path.isfile(path) for path in outputs):
+        cache.put(key, outputs)
+    return result
+
+
+'''
+# Second run of the same conversion is a copy
+cache = EncodeCache(os.path.expanduser('~/.cache/codificacio_video/encodes'), max_bytes=5 * 2 ** 30)
+command = ['ffmpeg', '-y', '-i', 'Bunny.mp4', '-c:v', 'libvpx-vp9', 'Bunny.webm']
+run_cached(command, ['Bunny.webm'], cache, check=True)
+run_cached(command, ['Bunny.webm'], cache, check=True)
+'''
@@ -0,0 +1,238 @@
+import heapq
+import numpy as np
+
+# Longest code allowed, same limit as JPEG. Keeps the decoding lookup table at 2^16 entries
+MAX_CODE_LENGTH = 16
+# Symbols encoded and bits decoded per step: the per-bit work arrays stay a few MB
+# whatever the size of the stream
+ENCODE_CHUNK = 1 << 16
+DECODE_CHUNK = 1 << 16
+# Pointer doubling levels of the decoder: it follows every 256th code start in Python
+JUMP_LEVELS = 8
+
+class HuffmanTable:
+    """
+    Canonical Huffman code over the symbols 0..n-1, defined only by the code
+    length of every symbol (0 = symbol not used).
+    """
+
+    def __init__(self, code_lengths):
+        self.code_lengths = np.asarray(code_lengths, dtype=np.uint8)
+        if self.code_lengths.max(initial=0) > MAX_CODE_LENGTH:
+            raise ValueError(f"Code lengths must be at most {MAX_CODE_LENGTH}")
+        self.codes = self._canonical_codes()
+        self.max_length = max(int(self.code_lengths.max(initial=0)), 1)
+        self._lookup = None
+
+    @classmethod
+    def from_frequencies(cls, frequencies):
+        """
+        Build the optimal table for some symbol frequencies.
+
+        Args:
+            frequencies (np.array): Count of every symbol, index = symbol.
+
+        Returns:
+            HuffmanTable: Table with codes of at most MAX_CODE_LENGTH bits.
+        """
+        frequencies = np.asarray(frequencies, dtype=np.int64)
+        while True:
+            lengths = _code_lengths(frequencies)
+            if lengths.max(initial=0) <= MAX_CODE_LENGTH:
+                return cls(lengths)
+            # too deep: flatten the distribution and try again (used symbols stay >= 1)
+            frequencies = np.where(frequencies > 0, np.maximum(frequencies // 2, 1), 0)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Read a table written by to_bytes (one byte per symbol).
+        """
+        return cls(np.frombuffer(data, dtype=np.uint8))
+
+    def to_bytes(self):
+        """
+        Serialize the table as the code length of every symbol.
+        """
+        return self.code_lengths.tobytes()
+
+    def _canonical_codes(self):
+        # symbols sorted by (length, symbol) get consecutive codes
+        codes = np.zeros(self.code_lengths.size, dtype=np.uint32)
+        code, previous_length = 0, 0
+        for symbol in np.lexsort((np.arange(self.code_lengths.size), self.code_lengths)):
+            length = int(self.code_lengths[symbol])
+            if length == 0:
+                continue
+            code <<= length - previous_length
+            codes[symbol] = code
+            code += 1
+            previous_length = length
+        return codes
+
+    def lookup_tables(self):
+        """
+        Decoding tables indexed by the next max_length bits of the stream.
+
+        Returns:
+            tuple: (symbols, lengths) arrays with 2^max_length entries each.
+        """
+        if self._lookup is None:
+            used = np.flatnonzero(self.code_lengths)
+            lengths = self.code_lengths[used].astype(np.int32)
+            # a code of length l owns every max_length-bit window that starts with it
+            spans = 1 << (self.max_length - lengths)
+            first = self.codes[used].astype(np.int32) << (self.max_length - lengths)
+
+            size = 1 << self.max_length
+            symbols = np.zeros(size, dtype=np.int32)
+            code_lengths = np.zeros(size, dtype=np.uint8)
+            index = np.repeat(first, spans) + _ranges(spans)
+            symbols[index] = np.repeat(used, spans)
+            code_lengths[index] = np.repeat(self.code_lengths[used], spans)
+            self._lookup = symbols, code_lengths
+        return self._lookup
+
+def _code_lengths(frequencies):
+    """
+    Huffman code length of every symbol, using a heap of (weight, id) nodes.
+    """
+    lengths = np.zeros(frequencies.size, dtype=np.int64)
+    used = np.flatnonzero(frequencies)
+    if used.size == 1:
+        lengths[used] = 1
+        return lengths
+
+    heap = [(int(frequencies[s]), i, [int(s)]) for i, s in enumerate(used)]
+    heapq.heapify(heap)
+    next_id = len(heap)
+    while len(heap) > 1:
+        weight_a, _, symbols_a = heapq.heappop(heap)
+        weight_b, _, symbols_b = heapq.heappop(heap)
+        # every symbol below the merged node gets one bit longer
+        lengths[symbols_a] += 1
+        lengths[symbols_b] += 1
+        heapq.heappush(heap, (weight_a + weight_b, next_id, symbols_a + symbols_b))
+        next_id += 1
+    return lengths
+
+def _ranges(counts):
+    # concatenation of arange(c) for every c in counts, without a Python loop (int32: the
+    # callers keep the total small)
+    counts = np.asarray(counts, dtype=np.int32)
+    starts = np.repeat(np.cumsum(counts, dtype=np.int32) - counts, counts)
+    return np.arange(int(counts.sum()), dtype=np.int32) - starts
+
+def _code_bits(codes, lengths):
+    # one uint8 per output bit, MSB first within every code
+    lengths = lengths.astype(np.int32)
+    shifts = np.repeat(lengths, lengths) - 1 - _ranges(lengths)
+    return ((np.repeat(codes, lengths) >> shifts.astype(np.uint32)) & 1).astype(np.uint8)
+
+def huffman_encode(symbols, table):
+    """
+    Encode symbols with a Huffman table, packing the bits ENCODE_CHUNK symbols at a time.
+
+    Args:
+        symbols (np.array): Integer symbols, all with a non-zero code length in table.
+        table (HuffmanTable): Code table.
+
+    Returns:
+        bytes: The codes packed MSB first, the last byte padded with zeros.
+    """
+    symbols = np.asarray(symbols).reshape(-1)
+    packed = []
+    # bits of the previous chunk that did not fill a byte
+    carry = np.zeros(0, dtype=np.uint8)
+    for start in range(0, symbols.size, ENCODE_CHUNK):
+        chunk = symbols[start:start + ENCODE_CHUNK]
+        lengths = table.code_lengths[chunk]
+        if not lengths.all():
+            raise ValueError("Some symbols have no code in this table")
+        bits = np.concatenate((carry, _code_bits(table.codes[chunk], lengths)))
+        whole = bits.size - bits.size % 8
+        packed.append(np.packbits(bits[:whole]).tobytes())
+        carry = bits[whole:]
+    packed.append(np.packbits(carry).tobytes())
+    return b''.join(packed)
+
+def huffman_decode(data, n_symbols, table):
+    """
+    Decode n_symbols symbols produced by huffman_encode.
+
+    Instead of walking a tree bit by bit, every bit position of the stream gets
+    looked up once in the table (symbol and code length starting there). Which
+    positions actually start a code is then found by pointer doubling over the
+    "next code starts at" array: only every 2^JUMP_LEVELS-th start is followed
+    in Python, the ones in between are filled in level by level. The stream is
+    handled DECODE_CHUNK bits at a time, each chunk starting where the last
+    code of the previous one ended.
+
+    Args:
+        data (bytes): Encoded bytes.
+        n_symbols (int): Number of symbols to decode.
+        table (HuffmanTable): Code table used to encode.
+
+    Returns:
+        np.array: Decoded symbols (int32).
+    """
+    decoded = np.zeros(n_symbols, dtype=np.int32)
+    if n_symbols == 0:
+        return decoded
+    lookup_symbols, lookup_lengths = table.lookup_tables()
+    max_length = table.max_length
+    mask = (1 << max_length) - 1
+    data = np.frombuffer(data, dtype=np.uint8)
+    total_bits = 8 * data.size
+
+    count, chunk_start, offset = 0, 0, 0
+    while count < n_symbols and chunk_start + offset < total_bits:
+        size = min(DECODE_CHUNK, total_bits - chunk_start)
+        # the max_length bits starting at every bit position, read from 3 bytes at a time
+        first_byte = chunk_start >> 3
+        padded = np.zeros(size // 8 + 3, dtype=np.uint32)
+        stop = min(first_byte + padded.size, data.size)
+        padded[:stop - first_byte] = data[first_byte:stop]
+        words = (padded[:-2] << 16) | (padded[1:-1] << 8) | padded[2:]
+        positions = np.arange(size, dtype=np.int32)
+        windows = (words[positions >> 3] >> (24 - max_length - (positions & 7)).astype(np.uint32)) & mask
+
+        # jump[i] = where the next code starts if a code starts at i (size = past this chunk)
+        jump = np.minimum(positions + lookup_lengths[windows], size)
+        jump = np.append(jump, np.int32(size))
+
+        # jumps[k] moves 2^k codes ahead
+        jumps = [jump]
+        for _ in range(JUMP_LEVELS):
+            jumps.append(jumps[-1][jumps[-1]])
+        # every 2^JUMP_LEVELS-th code start, a few hundred steps per chunk at most
+        coarse, position = [offset], int(jumps[-1][offset])
+        while position < size:
+            coarse.append(position)
+            position = int(jumps[-1][position])
+        # then the starts in between, halving the gap every level
+        starts = np.array(coarse, dtype=np.int32)
+        for jump in reversed(jumps[:-1]):
+            starts = np.stack((starts, jump[starts]), axis=1).reshape(-1)
+        starts = starts[starts < size][:n_symbols - count]
+
+        decoded[count:count + starts.size] = lookup_symbols[windows[starts]]
+        count += starts.size
+        # the last code may end in the next chunk
+        offset = int(starts[-1]) + int(lookup_lengths[windows[starts[-1]]]) - size
+        chunk_start += size
+    if count < n_symbols:
+        raise ValueError("Not enough data for the requested number of symbols")
+    return decoded
+
+'''
+# Encode random bytes with a table built from their own frequencies
+if __name__ == '__main__':
+    symbols = np.random.geometric(0.3, 10000).clip(0, 255).astype(np.uint8)
+    table = HuffmanTable.from_frequencies(np.bincount(symbols, minlength=256))
+    encoded = huffman_encode(symbols, table)
+    decoded = huffman_decode(encoded, symbols.size, table)
+
+    print("Raw size:", symbols.size, "Encoded size:", len(encoded))
+    print("Decoded matches:", np.array_equal(decoded, symbols))
+'''
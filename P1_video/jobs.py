@@ -0,0 +1,424 @@
+import asyncio
+import contextlib
+import json
+import os
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, asdict
+
+# If set, every job (and stage) gets reported as JSON lines into this file
+TELEMETRY_ENV = 'VIDEO_TELEMETRY_JSONL'
+
+@dataclass
+class ProgressEvent:
+    """
+    One update of ffmpeg's -progress output. Fields ffmpeg does not know yet are None.
+    """
+    job: str
+    frame: int | None = None
+    fps: float | None = None
+    speed: float | None = None
+    out_time: float | None = None
+    total_size: int | None = None
+    bitrate_kbps: float | None = None
+    cpu_time: float | None = None
+    done: bool = False
+
+def _parse_value(value, kind, suffix=''):
+    # '12.3x' -> 12.3, 'N/A' -> None
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[:-len(suffix)]
+    try:
+        return kind(value)
+    except ValueError:
+        return None
+
+def parse_progress(job, fields, cpu_time=None):
+    """
+    Turn one block of -progress key=value pairs into a ProgressEvent.
+    """
+    out_time_us = _parse_value(fields.get('out_time_us', ''), int)
+    return ProgressEvent(
+        job=job,
+        frame=_parse_value(fields.get('frame', ''), int),
+        fps=_parse_value(fields.get('fps', ''), float),
+        speed=_parse_value(fields.get('speed', ''), float, 'x'),
+        out_time=out_time_us / 1e6 if out_time_us is not None else None,
+        total_size=_parse_value(fields.get('total_size', ''), int),
+        bitrate_kbps=_parse_value(fields.get('bitrate', ''), float, 'kbits/s'),
+        cpu_time=cpu_time,
+        done=fields.get('progress') == 'end',
+    )
+
+def _process_cpu_time(pid):
+    # user + system CPU seconds of a running process, from /proc (None elsewhere)
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+class Telemetry:
+    """
+    Collects structured events of ffmpeg jobs: 'progress' updates while a job runs,
+    a 'job' summary when it ends and 'stage' timings around groups of jobs.
+    Every event is a dict given to the callback and/or written as a JSON line.
+    """
+
+    def __init__(self, callback=None, jsonl_path=None):
+        """
+        Args:
+            callback (callable, optional): Called with every event dict.
+            jsonl_path (str, optional): File the events are appended to, one JSON object per line.
+        """
+        self.callback = callback
+        self.jsonl_path = jsonl_path
+        self._lock = threading.Lock()
+
+    def emit(self, event_type, data):
+        event = {'type': event_type, 'time': time.time(), **data}
+        if self.callback is not None:
+            self.callback(event)
+        if self.jsonl_path is not None:
+            with self._lock, open(self.jsonl_path, 'a') as f:
+                f.write(json.dumps(event) + '\n')
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Time a block of work. Wall time, plus the CPU time of this process and of
+        the child processes (ffmpeg) that finished inside the block.
+        """
+        start_wall, start_cpu = time.perf_counter(), os.times()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            end_cpu = os.times()
+            self.emit('stage', {
+                'name': name,
+                'wall_time': time.perf_counter() - start_wall,
+                'cpu_time': (end_cpu.user - start_cpu.user) + (end_cpu.system - start_cpu.system),
+                'children_cpu_time': (end_cpu.children_user - start_cpu.children_user)
+                                     + (end_cpu.children_system - start_cpu.children_system),
+                'failed': failed,
+            })
+
+_default_telemetry = Telemetry(jsonl_path=os.environ[TELEMETRY_ENV]) if os.environ.get(TELEMETRY_ENV) else None
+
+def set_default_telemetry(telemetry):
+    """
+    Telemetry used by every job that does not get one explicitly, i.e. by all the
+    ffmpeg wrappers of the projects. None turns it off.
+    """
+    global _default_telemetry
+    _default_telemetry = telemetry
+
+def get_default_telemetry():
+    return _default_telemetry
+
+def stage(name):
+    """
+    Telemetry.stage on the default telemetry, or a no-op context without one.
+    """
+    if _default_telemetry is None:
+        return contextlib.nullcontext()
+    return _default_telemetry.stage(name)
+
+def command_threads(command):
+    """
+    CPU threads an ffmpeg command will use, from its -threads options.
+
+    Returns:
+        int: Sum of the -threads values (one per decoder/encoder that has one), or
+        None if ffmpeg picks the count itself (no -threads, or -threads 0): it then
+        uses every core. Other programs (ffprobe, ...) count as 1.
+    """
+    if not os.path.basename(str(command[0])).startswith('ffmpeg'):
+        return 1
+    # 'auto' and the like count as 0: ffmpeg decides
+    counts = [int(value) if str(value).isdigit() else 0
+              for option, value in zip(command, command[1:]) if option == '-threads']
+    if not counts or 0 in counts:
+        return None
+    return sum(counts)
+
+class JobRunner:
+    """
+    Run external commands (ffmpeg, ffprobe, ...) as asyncio subprocesses without
+    using more CPU threads than a fixed budget.
+
+    Every job says how many threads it will use (by default its ffmpeg -threads,
+    see command_threads) and only starts once that many are free, so a batch of
+    jobs keeps the cores busy without oversubscribing them. A runner belongs to
+    one event loop.
+
+        runner = JobRunner()
+        results = await runner.gather([command_a, command_b], threads=2)
+    """
+
+    def __init__(self, max_threads=None, parent=None):
+        """
+        Args:
+            max_threads (int, optional): CPU threads all the running jobs may use together.
+                Defaults to the number of cores.
+            parent (JobRunner, optional): Runner of the same event loop whose budget the
+                jobs also count against, for a smaller budget inside a shared one.
+        """
+        self.max_threads = max_threads or os.cpu_count() or 1
+        self.free_threads = self.max_threads
+        self.parent = parent
+        # created on first use, inside the running event loop
+        self._condition = None
+
+    async def _acquire(self, threads):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.free_threads >= threads)
+            self.free_threads -= threads
+        if self.parent is not None:
+            try:
+                await self.parent._acquire(min(threads, self.parent.max_threads))
+            except BaseException:
+                await self._release(threads, parent=False)
+                raise
+
+    async def _release(self, threads, parent=True):
+        if parent and self.parent is not None:
+            await self.parent._release(min(threads, self.parent.max_threads))
+        async with self._condition:
+            self.free_threads += threads
+            self._condition.notify_all()
+
+    async def run(self, command, threads=None, timeout=None, check=False, capture_output=False, text=False,
+                  input=None, stdin=None, telemetry=None, name=None):
+        """
+        Run one command once enough threads of the budget are free.
+
+        If the job times out or its task is cancelled, the process is killed before
+        the exception propagates, so nothing keeps running in the background.
+
+        Args:
+            command (list): Program and arguments. Shell strings are not accepted.
+            threads (int, optional): Threads the job uses (capped to the budget). Defaults to
+                command_threads: the whole budget for an ffmpeg left to pick its own count.
+            timeout (float, optional): Seconds before the job is killed and
+                subprocess.TimeoutExpired is raised.
+            check (bool): Raise subprocess.CalledProcessError on a non-zero exit code.
+            capture_output (bool): Collect stdout and stderr instead of inheriting them.
+            text (bool): Decode the captured output as text.
+            input (bytes, optional): Data sent to the process's stdin.
+            stdin (optional): stdin of the process when no input is given, e.g.
+                subprocess.DEVNULL for jobs that must not wait on the terminal.
+            telemetry (Telemetry, optional): Where progress and job events go. Defaults to
+                the default telemetry. For ffmpeg commands on POSIX, -progress is written to an
+                extra pipe (so stdout stays free) and parsed into ProgressEvents.
+            name (str, optional): Job name in the events. Defaults to the output file.
+
+        Returns:
+            subprocess.CompletedProcess: Same as subprocess.run would give.
+        """
+        if isinstance(command, str):
+            raise TypeError("Commands must be argument lists, not shell strings")
+        command = [str(arg) for arg in command]
+        if threads is None:
+            threads = command_threads(command) or self.max_threads
+        threads = min(max(threads, 1), self.max_threads)
+        telemetry = telemetry if telemetry is not None else _default_telemetry
+        name = name or command[-1]
+        # only ffmpeg knows -progress, other programs (ffprobe, ...) just get a job event.
+        # The extra pipe needs pass_fds, which only exists on POSIX
+        wants_progress = (telemetry is not None and os.name == 'posix'
+                          and os.path.basename(command[0]).startswith('ffmpeg'))
+
+        await self._acquire(threads)
+        start = time.perf_counter()
+        process, reader, cpu_time, progress_pipe = None, None, None, None
+        try:
+            # created only now, so jobs waiting for the budget hold no descriptors
+            progress_fds = os.pipe() if wants_progress else None
+            if progress_fds:
+                progress_pipe = os.fdopen(progress_fds[0], 'rb')
+                command = [command[0], '-progress', f'pipe:{progress_fds[1]}', '-nostats', *command[1:]]
+            pipe = asyncio.subprocess.PIPE if capture_output else None
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *command, stdin=asyncio.subprocess.PIPE if input is not None else stdin, stdout=pipe, stderr=pipe,
+                    pass_fds=progress_fds[1:] if progress_fds else ())
+            finally:
+                if progress_fds:
+                    # the child has its own copy of the write end (or failed to start)
+                    os.close(progress_fds[1])
+            if progress_pipe is not None:
+                # the reader owns the read end from here on
+                reader = asyncio.ensure_future(_read_progress(progress_pipe, process.pid, name, telemetry))
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(input), timeout)
+            except asyncio.TimeoutError:
+                await _kill(process)
+                raise subprocess.TimeoutExpired(command, timeout)
+            except asyncio.CancelledError:
+                await _kill(process)
+                raise
+            finally:
+                if reader is not None:
+                    cpu_time = await reader
+        finally:
+            if progress_pipe is not None and (reader is None or reader.cancelled()):
+                progress_pipe.close()
+            await self._release(threads)
+            if telemetry:
+                returncode = process.returncode if process is not None else None
+                telemetry.emit('job', {'job': name, 'command': command, 'returncode': returncode,
+                                       'wall_time': time.perf_counter() - start, 'cpu_time': cpu_time,
+                                       'threads': threads})
+
+        if text:
+            stdout = stdout.decode(errors='replace') if stdout is not None else None
+            stderr = stderr.decode(errors='replace') if stderr is not None else None
+        if check and process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, command, output=stdout, stderr=stderr)
+        return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+    async def gather(self, commands, threads=None, **kwargs):
+        """
+        Run several commands, as many at a time as the budget allows.
+
+        Args:
+            commands (list): Commands (argument lists).
+            threads (int or list, optional): Threads of every command, or one count per command.
+            **kwargs: Other options of run, the same for every command.
+
+        Returns:
+            list: CompletedProcess for every command, in order, or the exception it raised.
+        """
+        if isinstance(threads, (list, tuple)):
+            if len(threads) != len(commands):
+                raise ValueError(f"{len(threads)} thread counts for {len(commands)} commands")
+        else:
+            threads = [threads] * len(commands)
+        return await asyncio.gather(*(self.run(command, threads=count, **kwargs)
+                                      for command, count in zip(commands, threads)), return_exceptions=True)
+
+async def _read_progress(pipe, pid, name, telemetry):
+    """
+    Read ffmpeg's -progress pipe (a binary file object) until it closes, emitting
+    a ProgressEvent per block. The pipe is closed afterwards.
+
+    Returns:
+        float: Last CPU time sampled for the process (None if not available).
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    try:
+        transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    except BaseException:
+        pipe.close()
+        raise
+    fields, cpu_time = {}, None
+    try:
+        async for line in reader:
+            key, _, value = line.decode(errors='replace').strip().partition('=')
+            fields[key] = value
+            # every block ends with progress=continue or progress=end
+            if key == 'progress':
+                cpu_time = _process_cpu_time(pid) or cpu_time
+                telemetry.emit('progress', asdict(parse_progress(name, fields, cpu_time)))
+                fields = {}
+    finally:
+        transport.close()
+    return cpu_time
+
+async def _kill(process):
+    # kill a process that is still running and reap it
+    if process.returncode is None:
+        process.kill()
+        await process.wait()
+
+# One runner for the whole process, on its own event loop in a background thread,
+# so every blocking call (from any thread, or from inside another event loop)
+# shares the same core budget
+_shared_loop = None
+_shared_thread = None
+_shared_runner = None
+_shared_lock = threading.Lock()
+
+def get_shared_runner():
+    """
+    The process-wide JobRunner and the event loop it runs on, started on first use.
+
+    Returns:
+        tuple: (loop, runner).
+    """
+    global _shared_loop, _shared_thread, _shared_runner
+    with _shared_lock:
+        if _shared_loop is None:
+            loop = asyncio.new_event_loop()
+            _shared_thread = threading.Thread(target=loop.run_forever, name='job-runner', daemon=True)
+            _shared_thread.start()
+            _shared_loop, _shared_runner = loop, JobRunner()
+        return _shared_loop, _shared_runner
+
+def _run_shared(make_coroutine):
+    # run a coroutine on the shared loop and wait for it here
+    loop, runner = get_shared_runner()
+    if threading.current_thread() is _shared_thread:
+        raise RuntimeError("Blocking job calls cannot be made from the job runner's own loop")
+    future = asyncio.run_coroutine_threadsafe(make_coroutine(runner), loop)
+    try:
+        return future.result()
+    except BaseException:
+        # e.g. Ctrl+C while waiting: cancelling the job kills its process
+        future.cancel()
+        raise
+
+def run_command(command, **kwargs):
+    """
+    Blocking version of JobRunner.run, a drop-in replacement for subprocess.run
+    (check, timeout, capture_output, text, input, stdin) used by all the ffmpeg
+    wrappers. Also takes telemetry and name.
+
+    Every call goes to the process-wide runner (get_shared_runner), so threads
+    calling it at the same time share one core budget. The frame pipes of
+    rawvideo (read_frames, FrameWriter) are not jobs and do not count against it.
+
+    Returns:
+        subprocess.CompletedProcess: The finished process.
+    """
+    return _run_shared(lambda runner: runner.run(command, **kwargs))
+
+def run_commands(commands, max_threads=None, **kwargs):
+    """
+    Blocking version of JobRunner.gather, on the process-wide runner.
+
+    Args:
+        commands (list): Commands (argument lists).
+        max_threads (int, optional): Smaller CPU thread budget for these commands,
+            inside the process-wide one.
+        **kwargs: Options of JobRunner.gather (threads, one count or one per command)
+            and JobRunner.run (timeout, check, ...).
+
+    Returns:
+        list: CompletedProcess for every command, in order, or the exception it raised.
+    """
+    def gather(runner):
+        if max_threads:
+            runner = JobRunner(max_threads, parent=runner)
+        return runner.gather(commands, **kwargs)
+
+    return _run_shared(gather)
+
+
+'''
+# Print the progress of every ffmpeg job and keep all the events in a JSON lines file
+telemetry = Telemetry(callback=lambda event: print(event['type'], event.get('frame'), event.get('speed')),
+                      jsonl_path='telemetry.jsonl')
+set_default_telemetry(telemetry)
+with stage('resize'):
+    run_command(['ffmpeg', '-y', '-i', '../P2_video/badbunny10.mp4', '-vf', 'scale=320:240', 'small.mp4'])
+'''
@@ -0,0 +1,28 @@
+import importlib.util
+import sys
+
+def lazy_import(name):
+    """
+    Import a module on first attribute access instead of now.
+
+    Modules that only need NumPy (or another heavy dependency) for some of their
+    functions use this at the top, so importing them for the ffmpeg wrappers
+    alone stays fast.
+
+    Args:
+        name (str): Module name, e.g. 'numpy'.
+
+    Returns:
+        module: The module, already imported or loaded on first use.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
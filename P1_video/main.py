@@ -1,6 +1,18 @@
+import mmap
+import os
 import subprocess
-import numpy as np
-from scipy.fftpack import dct, idct
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from .encode_cache import run_cached
+from .jobs import run_command
+from .lazy import lazy_import
+
+# NumPy loads on first use and SciPy inside DCTConverter, so the ffmpeg wrappers
+# of this module can be imported without paying for either
+np = lazy_import('numpy')
 
 def rgb_to_yuv(rgb):
     """
@@ -30,6 +42,124 @@ def yuv_to_rgb(yuv):
     B = Y + 2.032 * U
     return int(R), int(G), int(B)
 
+# Fixed-point versions of the matrices: coefficients scaled by 2^14 so everything fits in int32
+FIXED_POINT_BITS = 14
+
+@lru_cache(maxsize=None)
+def _color_matrices():
+    """
+    Same coefficients as rgb_to_yuv / yuv_to_rgb, as matrices for whole frames.
+    Built on first use so importing this module does not load NumPy.
+
+    Returns:
+        tuple: float32 RGB->YUV and YUV->RGB matrices, then their int32 fixed-point versions.
+    """
+    rgb_to_yuv_matrix = np.array([[0.299, 0.587, 0.114],
+                                  [-0.147, -0.289, 0.436],
+                                  [0.615, -0.515, -0.100]], dtype=np.float32)
+    yuv_to_rgb_matrix = np.array([[1.0, 0.0, 1.140],
+                                  [1.0, -0.395, -0.581],
+                                  [1.0, 2.032, 0.0]], dtype=np.float32)
+    for matrix in (rgb_to_yuv_matrix, yuv_to_rgb_matrix):
+        matrix.flags.writeable = False
+    fixed = [np.round(matrix.astype(np.float64) * (1 << FIXED_POINT_BITS)).astype(np.int32)
+             for matrix in (rgb_to_yuv_matrix, yuv_to_rgb_matrix)]
+    return rgb_to_yuv_matrix, yuv_to_rgb_matrix, *fixed
+
+def __getattr__(name):
+    # RGB_TO_YUV_MATRIX and YUV_TO_RGB_MATRIX stay importable as module constants
+    if name == 'RGB_TO_YUV_MATRIX':
+        return _color_matrices()[0]
+    if name == 'YUV_TO_RGB_MATRIX':
+        return _color_matrices()[1]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _fixed_point_transform(frame, matrix, out, round_half):
+    """
+    Multiply every pixel of a (..., 3) integer frame by a fixed-point 3x3 matrix.
+
+    Works channel by channel with two int32 accumulators reused for the three
+    output channels, so the only allocations are per frame, never per pixel.
+    """
+    acc = np.empty(frame.shape[:-1], dtype=np.int32)
+    tmp = np.empty(frame.shape[:-1], dtype=np.int32)
+    for k in range(3):
+        np.multiply(frame[..., 0], matrix[k, 0], out=acc, dtype=np.int32)
+        for c in (1, 2):
+            np.multiply(frame[..., c], matrix[k, c], out=tmp, dtype=np.int32)
+            acc += tmp
+        if round_half:
+            acc += 1 << (FIXED_POINT_BITS - 1)
+        # arithmetic shift = floor division by 2^14
+        np.right_shift(acc, FIXED_POINT_BITS, out=acc)
+        if out.dtype == np.uint8:
+            np.clip(acc, 0, 255, out=acc)
+        out[..., k] = acc
+    return out
+
+def rgb_to_yuv_frame(frame, out=None, fixed_point=False):
+    """
+    Convert whole RGB frames to YUV in one vectorized pass.
+
+    Args:
+        frame (np.array): RGB data with shape (..., 3), e.g. a frame (H, W, 3) or a batch
+            of frames (N, H, W, 3). uint8 or float32.
+        out (np.array, optional): Preallocated output with the same shape as frame.
+            Defaults to float32 (int16 for the fixed-point path).
+        fixed_point (bool): Use integer arithmetic instead of floats. Needs integer input,
+            results are rounded to the nearest integer.
+
+    Returns:
+        np.array: YUV data with the same shape as the input (out if it was given).
+    """
+    frame = np.asarray(frame)
+    if frame.shape[-1] != 3:
+        raise ValueError(f"Expected a (..., 3) RGB array, got shape {frame.shape}")
+
+    if fixed_point:
+        if not np.issubdtype(frame.dtype, np.integer):
+            raise ValueError("The fixed-point path needs integer (e.g. uint8) input")
+        if out is None:
+            out = np.empty(frame.shape, dtype=np.int16)
+        return _fixed_point_transform(frame, _color_matrices()[2], out, round_half=True)
+
+    if out is None:
+        out = np.empty(frame.shape, dtype=np.float32)
+    # (..., 3) @ (3, 3) applies the matrix to every pixel at once
+    return np.matmul(frame, _color_matrices()[0].T, out=out)
+
+def yuv_to_rgb_frame(frame, out=None, fixed_point=False):
+    """
+    Convert whole YUV frames back to RGB in one vectorized pass.
+
+    Like yuv_to_rgb, values are truncated to integers, and they are also clipped
+    to [0, 255] so they fit in uint8.
+
+    Args:
+        frame (np.array): YUV data with shape (..., 3), float32 (or int16 for the fixed-point path).
+        out (np.array, optional): Preallocated uint8 output with the same shape as frame.
+        fixed_point (bool): Use integer arithmetic instead of floats. Needs integer input.
+
+    Returns:
+        np.array: uint8 RGB data with the same shape as the input (out if it was given).
+    """
+    frame = np.asarray(frame)
+    if frame.shape[-1] != 3:
+        raise ValueError(f"Expected a (..., 3) YUV array, got shape {frame.shape}")
+    if out is None:
+        out = np.empty(frame.shape, dtype=np.uint8)
+
+    if fixed_point:
+        if not np.issubdtype(frame.dtype, np.integer):
+            raise ValueError("The fixed-point path needs integer (e.g. int16) input")
+        return _fixed_point_transform(frame, _color_matrices()[3], out, round_half=False)
+
+    rgb = np.matmul(frame, _color_matrices()[1].T, dtype=np.float32)
+    np.clip(rgb, 0, 255, out=rgb)
+    # unsafe cast truncates like int() does in the scalar version
+    np.copyto(out, rgb, casting='unsafe')
+    return out
+
 def resize_lower(input_path, output_path, width, height, quality):
     """
      Args:
@@ -45,20 +175,115 @@ def resize_lower(input_path, output_path, width, height, quality):
     cmd = [
         'ffmpeg',
         '-i', input_path,
-        '-vf', f'scale={width}:{height}',
-        '-q:v', str(quality),
+        *_resize_args(width, height, quality),
         output_path
     ]
     try:
-        subprocess.run(cmd, check=True)
+        run_cached(cmd, [output_path], check=True)
         print(f"Image resized and saved to {output_path}")
     except subprocess.CalledProcessError as e:
         print(f"Error: {e}")
 
+# A 4K order is 33 MB even as uint32, the cache only keeps the sizes in use right now
+@lru_cache(maxsize=4)
+def serpentine_order(width, height):
+    """
+    Serpentine scan order of a width x height image: even rows left to right,
+    odd rows right to left.
+
+    Built once per size and kept in a small LRU cache. The array is read-only
+    because it is shared between callers.
+
+    Returns:
+        np.array: Flat indices in scan order (uint32 when they fit), length width * height.
+    """
+    dtype = np.uint32 if width * height <= np.iinfo(np.uint32).max + 1 else np.intp
+    order = np.arange(width * height, dtype=dtype).reshape(height, width)
+    order[1::2] = order[1::2, ::-1]
+    order = order.ravel()
+    order.flags.writeable = False
+    return order
+
+@lru_cache(maxsize=16)
+def zigzag_order(block_size=8):
+    """
+    JPEG zigzag scan order of a block_size x block_size block
+    (0, 1, 8, 16, 9, 2, ... for 8x8).
+
+    Returns:
+        np.array: Flat indices in scan order, length block_size ** 2 (read-only, cached).
+    """
+    cells = [(i, j) for i in range(block_size) for j in range(block_size)]
+    # walk the anti-diagonals, going down on odd ones and up on even ones
+    cells.sort(key=lambda c: (c[0] + c[1], c[0] if (c[0] + c[1]) % 2 else -c[0]))
+    order = np.array([i * block_size + j for i, j in cells], dtype=np.intp)
+    order.flags.writeable = False
+    return order
+
+@lru_cache(maxsize=16)
+def inverse_zigzag_order(block_size=8):
+    """
+    Inverse permutation of zigzag_order (read-only, cached).
+    """
+    order = np.argsort(zigzag_order(block_size))
+    order.flags.writeable = False
+    return order
+
+def zigzag_scan(blocks):
+    """
+    Read every block of a coefficient array in zigzag order at once.
+
+    Args:
+        blocks (np.array): Blocks with shape (..., B, B), e.g. from DCTConverter.encode_blocks.
+
+    Returns:
+        np.array: Coefficients with shape (..., B * B) in zigzag order.
+    """
+    block_size = blocks.shape[-1]
+    flat = blocks.reshape(blocks.shape[:-2] + (block_size * block_size,))
+    return np.take(flat, zigzag_order(block_size), axis=-1)
+
+def inverse_zigzag_scan(coefficients, block_size=8):
+    """
+    Undo zigzag_scan.
+
+    Args:
+        coefficients (np.array): Coefficients with shape (..., B * B) in zigzag order.
+        block_size (int): Side of the blocks.
+
+    Returns:
+        np.array: Blocks with shape (..., B, B).
+    """
+    flat = np.take(coefficients, inverse_zigzag_order(block_size), axis=-1)
+    return flat.reshape(coefficients.shape[:-1] + (block_size, block_size))
+
+def serpentine_scan(data, width, height):
+    """
+    Gather the first width * height bytes of data in serpentine order.
+
+    Args:
+        data (bytes, buffer or np.array): Pixel bytes, row by row.
+        width (int): Width of the image in pixels.
+        height (int): Height of the image in pixels.
+
+    Returns:
+        np.array: uint8 array with the bytes in serpentine order.
+    """
+    if not isinstance(data, np.ndarray):
+        # wraps the buffer, no copy
+        data = np.frombuffer(data, dtype=np.uint8)
+    data = data.reshape(-1)
+    if data.size < width * height:
+        raise ValueError(f"Need {width * height} bytes for a {width}x{height} image, got {data.size}")
+    return np.take(data, serpentine_order(width, height))
+
 def read_image_serpentine(filename, width, height):
     """
         Read the bytes of an image file in a serpentine way.
 
+        The file is memory-mapped, so only the width * height bytes that are
+        scanned get read.
+
         Args:
             filename (str): The path to the image file.
             width (int): Width of the image in pixels.
@@ -67,33 +292,15 @@ def read_image_serpentine(filename, width, height):
         Returns:
             bytes: The serpentine bytes of the JPEG file.
     """
-    with open(filename, 'rb') as file:
-        data = file.read()
-
-    # Initialize variables for zigzag order
-    serpentine_data = bytearray(width * height)
-    x, y = -1, 0
-    direction = 1  # 1 for right, -1 for left
-
-    for i in range(width * height):
-        index = y * width + x
-        serpentine_data[i] = data[index]
-
-        if y % 2 == 0:
-            x += direction
-        else:
-            x -= direction
-
-        if x < 0:
-            y += 1
-            x = 0
-            direction = 1
-        elif x >= width:
-            y += 1
-            x = width - 1
-            direction = -1
+    with open(filename, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if len(mapped) < width * height:
+            raise ValueError(f"Need {width * height} bytes for a {width}x{height} image, got {len(mapped)}")
+        data = np.frombuffer(mapped, dtype=np.uint8, count=width * height)
+        serpentine_data = serpentine_scan(data, width, height)
+        # the view must be gone before the mapping can be closed
+        del data
 
-    return bytes(serpentine_data)
+    return serpentine_data.tobytes()
 
 def convert_to_bw_compression(input_image, output_image):
     """
@@ -107,27 +314,166 @@ def convert_to_bw_compression(input_image, output_image):
     ffmpeg_command = [
         "ffmpeg",
         "-i", input_image,
-        "-vf", "format=gray",
-        "-q:v", "100",  # high compression
+        *_bw_compression_args(),
         output_image
     ]
 
     try:
-        subprocess.run(ffmpeg_command, check=True)
+        run_cached(ffmpeg_command, [output_image], check=True)
         print(f"Image converted and compressed to {output_image}")
     except subprocess.CalledProcessError as e:
         print(f"Error: {e}")
 
-def run_length_encode(data):
+def _resize_args(width, height, quality):
+    # ffmpeg output options of resize_lower
+    return ['-vf', f'scale={width}:{height}', '-q:v', str(quality)]
+
+def _bw_compression_args():
+    # ffmpeg output options of convert_to_bw_compression
+    return ['-vf', 'format=gray', '-q:v', '100']  # high compression
+
+# Result of one image of a batch. seconds is the file's share of the ffmpeg run it was part of
+ImageResult = namedtuple('ImageResult', ['input_path', 'output_path', 'success', 'error', 'seconds'])
+
+def _file_state(path):
+    # what tells a file rewritten by ffmpeg from the one that was there before (None: no file)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+def _run_image_chunk(jobs):
     """
-    Apply run-length encoding (RLE) to a series of bytes.
+    Process several images with a single ffmpeg invocation (one input and one
+    output per image). If that fails, the images whose output was written count
+    as done and only the others are run again, one ffmpeg per image, so every
+    failing file gets its own error.
 
     Args:
-        data (bytes): Input byte sequence to be encoded.
+        jobs (list): (input_path, output_path, output_args) tuples.
 
     Returns:
-        bytes: RLE encoded byte sequence.
+        list: One ImageResult per job.
+    """
+    command = ['ffmpeg', '-v', 'error', '-nostdin', '-y']
+    for input_path, _, _ in jobs:
+        command += ['-i', input_path]
+    for i, (_, output_path, output_args) in enumerate(jobs):
+        command += ['-map', f'{i}:v:0', *output_args, '-frames:v', '1', output_path]
+
+    before = [_file_state(output_path) for _, output_path, _ in jobs]
+    start = time.perf_counter()
+    # one frame per output: nothing for ffmpeg's threads to share, the pool of chunks is the parallelism
+    result = run_command(command, threads=1, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode == 0:
+        return [ImageResult(input_path, output_path, True, None, elapsed / len(jobs))
+                for input_path, output_path, _ in jobs]
+    if len(jobs) > 1:
+        results = []
+        for job, state in zip(jobs, before):
+            after = _file_state(job[1])
+            if after is not None and after != state and after[1] > 0:
+                results.append(ImageResult(job[0], job[1], True, None, elapsed / len(jobs)))
+            else:
+                results += _run_image_chunk([job])
+        return results
+    input_path, output_path, _ = jobs[0]
+    return [ImageResult(input_path, output_path, False, result.stderr.strip() or f"ffmpeg exited with {result.returncode}", elapsed)]
+
+def _check_image_outputs(jobs):
+    """
+    Refuse batches where an output would overwrite another output or an input
+    (e.g. a.jpg and b/a.jpg into the same directory, or output_dir = the input directory).
+    """
+    def key(path):
+        return os.path.normcase(os.path.realpath(path))
+
+    inputs = {key(input_path) for input_path, _, _ in jobs}
+    outputs = {}
+    for input_path, output_path, _ in jobs:
+        output = key(output_path)
+        if output in inputs:
+            raise ValueError(f"Output {output_path} would overwrite an input")
+        if output in outputs:
+            raise ValueError(f"{outputs[output]} and {input_path} would both be written to {output_path}")
+        outputs[output] = input_path
+
+def _run_image_batch(jobs, workers=None, chunk_size=32):
+    """
+    Spread image jobs over a bounded pool of workers, chunk_size images per ffmpeg run.
+
+    Raises:
+        ValueError: If two jobs write the same file, or a job writes over an input.
+
+    Returns:
+        list: One ImageResult per job, in the same order as jobs.
     """
+    _check_image_outputs(jobs)
+    workers = workers or os.cpu_count() or 1
+    # no point in chunks so big that some workers get nothing
+    chunk_size = max(1, min(chunk_size, -(-len(jobs) // workers)))
+    chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+    # ffmpeg does the work, threads are enough to wait on it
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return [r for chunk_results in pool.map(_run_image_chunk, chunks) for r in chunk_results]
+
+def batch_resize_lower(input_paths, output_dir, width, height, quality, workers=None, chunk_size=32):
+    """
+    resize_lower for many images at once.
+
+    Args:
+        input_paths (list): Paths to the input image files.
+        output_dir (str): Directory for the outputs (same file names as the inputs).
+        width (int): New width in pixels.
+        height (int): New height in pixels.
+        quality (int): Output image quality (0-51; lower values mean higher compression).
+        workers (int, optional): Concurrent ffmpeg processes. Defaults to the number of cores.
+        chunk_size (int): Images handled by one ffmpeg process.
+
+    Raises:
+        ValueError: If two inputs have the same name, or an output would replace an input.
+
+    Returns:
+        list: One ImageResult(input_path, output_path, success, error, seconds) per input.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [(path, os.path.join(output_dir, os.path.basename(path)), _resize_args(width, height, quality))
+            for path in input_paths]
+    return _run_image_batch(jobs, workers, chunk_size)
+
+def batch_convert_to_bw_compression(input_paths, output_dir, workers=None, chunk_size=32):
+    """
+    convert_to_bw_compression for many images at once.
+
+    Args:
+        input_paths (list): Paths to the input image files.
+        output_dir (str): Directory for the outputs (same names, .jpg extension).
+        workers (int, optional): Concurrent ffmpeg processes. Defaults to the number of cores.
+        chunk_size (int): Images handled by one ffmpeg process.
+
+    Raises:
+        ValueError: If two inputs have the same name, or an output would replace an input.
+
+    Returns:
+        list: One ImageResult(input_path, output_path, success, error, seconds) per input.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = []
+    for path in input_paths:
+        name = os.path.splitext(os.path.basename(path))[0] + '.jpg'
+        jobs.append((path, os.path.join(output_dir, name), _bw_compression_args()))
+    return _run_image_batch(jobs, workers, chunk_size)
+
+# Longest run one (count, value) pair can hold
+RLE_MAX_RUN = 255
+# Below this many bytes the plain loop is cheaper than setting up NumPy
+RLE_SMALL_INPUT = 64
+
+def _run_length_encode_small(data):
+    # Original byte-by-byte encoder, only used for inputs shorter than
+    # RLE_SMALL_INPUT (below RLE_MAX_RUN, so a count can never overflow a byte)
     encoded_data = bytearray()
     i = 0
 
@@ -142,20 +488,245 @@ def run_length_encode(data):
 
     return bytes(encoded_data)
 
+def _find_runs(data):
+    """
+    Find all the runs of a uint8 array at once.
+
+    Returns:
+        tuple: (values, lengths) arrays, one entry per run.
+    """
+    # a new run starts wherever a byte differs from the previous one
+    starts = np.flatnonzero(data[1:] != data[:-1]) + 1
+    starts = np.concatenate(([0], starts))
+    lengths = np.diff(np.append(starts, data.size))
+    return data[starts], lengths
+
+def _pack_runs(values, lengths):
+    """
+    Turn runs into (count, value) byte pairs, splitting runs longer than
+    RLE_MAX_RUN into several pairs.
+    """
+    pieces = (lengths + RLE_MAX_RUN - 1) // RLE_MAX_RUN
+    counts = np.full(int(pieces.sum()), RLE_MAX_RUN, dtype=np.uint8)
+    # only the last piece of every run holds the remainder
+    counts[np.cumsum(pieces) - 1] = lengths - (pieces - 1) * RLE_MAX_RUN
+
+    encoded = np.empty(2 * counts.size, dtype=np.uint8)
+    encoded[0::2] = counts
+    encoded[1::2] = np.repeat(values, pieces)
+    return encoded
+
+def run_length_encode(data):
+    """
+    Apply run-length encoding (RLE) to a series of bytes.
+
+    The output is a sequence of (count, value) byte pairs. Runs longer than 255
+    are split into several pairs with the same value.
+
+    Args:
+        data (bytes): Input byte sequence to be encoded.
+
+    Returns:
+        bytes: RLE encoded byte sequence.
+    """
+    # flatten first: the length of a 2-D array is its number of rows, not of bytes
+    data = np.ravel(data) if isinstance(data, np.ndarray) else data
+    if len(data) < RLE_SMALL_INPUT:
+        return _run_length_encode_small(data)
+
+    data = np.frombuffer(data, dtype=np.uint8) if not isinstance(data, np.ndarray) else data
+    values, lengths = _find_runs(data)
+    return _pack_runs(values, lengths).tobytes()
+
+def run_length_decode(encoded_data):
+    """
+    Decode bytes produced by run_length_encode.
+
+    Args:
+        encoded_data (bytes): RLE encoded byte sequence of (count, value) pairs.
+
+    Returns:
+        bytes: Decoded byte sequence.
+    """
+    encoded = np.frombuffer(encoded_data, dtype=np.uint8) if not isinstance(encoded_data, np.ndarray) \
+        else encoded_data.reshape(-1)
+    if encoded.size % 2:
+        raise ValueError("RLE data must be made of (count, value) pairs")
+    return np.repeat(encoded[1::2], encoded[0::2]).tobytes()
+
+def run_length_encode_stream(input_file, output_file, chunk_size=1 << 20):
+    """
+    Run-length encode a file-like object into another one in constant memory.
+
+    The output is the same as run_length_encode on the whole input. The last run
+    of every chunk is held back, since it can continue in the next chunk.
+
+    Args:
+        input_file: Binary file-like object to read from.
+        output_file: Binary file-like object to write the (count, value) pairs to.
+        chunk_size (int): Bytes read at a time.
+
+    Returns:
+        int: Number of encoded bytes written.
+    """
+    written = 0
+    pending_value, pending_length = None, 0
+
+    while True:
+        chunk = input_file.read(chunk_size)
+        if not chunk:
+            break
+        values, lengths = _find_runs(np.frombuffer(chunk, dtype=np.uint8))
+
+        if pending_length:
+            if values[0] == pending_value:
+                lengths[0] += pending_length
+            else:
+                values = np.concatenate(([pending_value], values))
+                lengths = np.concatenate(([pending_length], lengths))
+
+        pending_value, pending_length = values[-1], int(lengths[-1])
+        if values.size > 1:
+            written += output_file.write(_pack_runs(values[:-1], lengths[:-1]).tobytes())
+
+    if pending_length:
+        written += output_file.write(_pack_runs(np.array([pending_value], dtype=np.uint8),
+                                                np.array([pending_length])).tobytes())
+    return written
+
+def run_length_decode_stream(input_file, output_file, chunk_size=1 << 20):
+    """
+    Decode a file-like object produced by run_length_encode(_stream) in constant memory.
+
+    Args:
+        input_file: Binary file-like object with (count, value) pairs.
+        output_file: Binary file-like object to write the decoded bytes to.
+        chunk_size (int): Encoded bytes read at a time (rounded down to whole pairs).
+
+    Returns:
+        int: Number of decoded bytes written.
+    """
+    chunk_size = max(2, chunk_size - chunk_size % 2)
+    written = 0
+
+    while True:
+        chunk = input_file.read(chunk_size)
+        if not chunk:
+            break
+        if len(chunk) % 2:
+            # a short read can split a pair, get the missing byte
+            chunk += input_file.read(1)
+        written += output_file.write(run_length_decode(chunk))
+    return written
+
+def frame_to_blocks(data, block_size=8):
+    """
+    Split a frame (or a stack of frames) into block_size x block_size blocks.
+
+    The right and bottom edges are padded by repeating the last row/column, so
+    any frame size works.
+
+    Args:
+        data (np.array): Input with shape (H, W) or (..., H, W).
+        block_size (int): Side of the square blocks.
+
+    Returns:
+        np.array: Blocks with shape (..., H_blocks, W_blocks, block_size, block_size).
+    """
+    data = np.asarray(data)
+    height, width = data.shape[-2:]
+    pad_h = -height % block_size
+    pad_w = -width % block_size
+    if pad_h or pad_w:
+        pad = [(0, 0)] * (data.ndim - 2) + [(0, pad_h), (0, pad_w)]
+        data = np.pad(data, pad, mode='edge')
+
+    blocks_h = data.shape[-2] // block_size
+    blocks_w = data.shape[-1] // block_size
+    # (..., Hb, B, Wb, B) -> (..., Hb, Wb, B, B), no copy until somebody needs one
+    blocks = data.reshape(data.shape[:-2] + (blocks_h, block_size, blocks_w, block_size))
+    return blocks.swapaxes(-3, -2)
+
+def blocks_to_frame(blocks, height=None, width=None):
+    """
+    Put blocks from frame_to_blocks back together into a frame.
+
+    Args:
+        blocks (np.array): Blocks with shape (..., H_blocks, W_blocks, B, B).
+        height (int, optional): Original height, to crop the edge padding away.
+        width (int, optional): Original width, to crop the edge padding away.
+
+    Returns:
+        np.array: Frame with shape (..., height, width).
+    """
+    blocks_h, blocks_w, block_size = blocks.shape[-4], blocks.shape[-3], blocks.shape[-1]
+    frame = blocks.swapaxes(-3, -2).reshape(blocks.shape[:-4] + (blocks_h * block_size, blocks_w * block_size))
+    return frame[..., :height, :width]
+
 class DCTConverter:
-    def __init__(self, block_size=8):
+    def __init__(self, block_size=8, batched=False, dtype=None):
+        """
+        Args:
+            block_size (int): Side of the square DCT blocks.
+            batched (bool): Transform all the blocks at once instead of one by one. Works with
+                any frame size (edge blocks are padded) and with stacks of frames (..., H, W).
+            dtype (np.dtype, optional): Working precision for the batched mode, e.g. np.float32
+                to halve memory. Defaults to float64.
+        """
         self.block_size = block_size
+        self.batched = batched
+        self.dtype = np.dtype(dtype) if dtype is not None else np.dtype(np.float64)
+
+    def encode_blocks(self, data):
+        """
+        Encode all the blocks of a frame (or a stack of frames) at once.
+
+        Args:
+            data (np.array): Input with shape (H, W) or (..., H, W).
+
+        Returns:
+            np.array: DCT coefficients with shape (..., H_blocks, W_blocks, B, B).
+        """
+        blocks = frame_to_blocks(np.asarray(data, dtype=self.dtype), self.block_size)
+        from scipy.fftpack import dct
+
+        # 2D dct = 1D dct over the rows and then over the columns of every block
+        return dct(dct(blocks, axis=-1, norm='ortho'), axis=-2, norm='ortho')
+
+    def decode_blocks(self, encoded_blocks, height=None, width=None):
+        """
+        Decode blocks from encode_blocks back into a frame.
+
+        Args:
+            encoded_blocks (np.array): DCT coefficients with shape (..., H_blocks, W_blocks, B, B).
+            height (int, optional): Original height, to crop the edge padding away.
+            width (int, optional): Original width, to crop the edge padding away.
+
+        Returns:
+            np.array: Decoded data with shape (..., height, width).
+        """
+        from scipy.fftpack import idct
+
+        encoded_blocks = np.asarray(encoded_blocks, dtype=self.dtype)
+        blocks = idct(idct(encoded_blocks, axis=-2, norm='ortho'), axis=-1, norm='ortho')
+        return blocks_to_frame(blocks, height, width)
 
     def encode(self, data):
         """
         Encode input data using DCT.
 
+        In batched mode the output is padded up to a multiple of the block size.
+
         Args:
             data (np.array): Input data as a NumPy array.
 
         Returns:
             np.array: DCT encoded data.
         """
+        if self.batched:
+            return blocks_to_frame(self.encode_blocks(data))
+        from scipy.fftpack import dct
+
         # creates encoded array same size as data
         encoded_data = np.zeros_like(data)
 
@@ -172,12 +743,18 @@ class DCTConverter:
         """
         Decode DCT encoded data.
 
+        In batched mode the input must be a multiple of the block size (as returned by encode),
+        crop the result to get back the original size.
+
         Args:
             encoded_data (np.array): DCT encoded data.
 
         Returns:
             np.array: Decoded data.
         """
+        if self.batched:
+            return self.decode_blocks(frame_to_blocks(encoded_data, self.block_size))
+        from scipy.fftpack import idct
 
         # All the same as encode but with idct
         decoded_data = np.zeros_like(encoded_data)
@@ -214,7 +791,7 @@ resize_lower(input_image, output_image, new_width, new_height, output_quality)
 
 """
 # ex 3
-serpentine_bytes = read_jpeg_serpentine("kirby8x8.jpg", 8, 8)
+serpentine_bytes = read_image_serpentine("kirby8x8.jpg", 8, 8)
 """
 
 """
@@ -222,12 +799,24 @@ serpentine_bytes = read_jpeg_serpentine("kirby8x8.jpg", 8, 8)
 convert_to_bw_compression("duki.jpg", "duki_bw_compressed.jpg")
 """
 
+"""
+# ex 2 and 4 for a whole directory
+import glob
+
+images = glob.glob("*.jpg")
+for result in batch_resize_lower(images, "thumbnails", 160, 120, 20):
+    print(result)
+for result in batch_convert_to_bw_compression(images, "bw"):
+    print(result)
+"""
+
 """
 # ex 5
 input_bytes = b'\x01\x01\x01\x01\x01\x01\x02\x03\x03\x04\x05\x05\x05\x05\x05\x05\xFF'
 encoded_bytes = run_length_encode(input_bytes)
 print("Input bytes: ", input_bytes)
 print("Encoded Bytes:", encoded_bytes)
+print("Decoded Bytes:", run_length_decode(encoded_bytes))
 """
 
 """
@@ -0,0 +1,261 @@
+import contextlib
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from fractions import Fraction
+
+from .jobs import run_command
+
+# Where probe results are kept between runs, override with the VIDEO_PROBE_CACHE environment variable
+DEFAULT_CACHE_PATH = os.environ.get(
+    'VIDEO_PROBE_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'codificacio_video', 'probe.sqlite3'))
+
+MEDIA_EXTENSIONS = ('.mp4', '.mkv', '.webm', '.mov', '.avi', '.mp3', '.mp2', '.aac', '.wav', '.m4a', '.ts')
+
+class ProbeError(Exception):
+    """
+    ffprobe could not read a file.
+    """
+
+def _number(value, kind=float):
+    # ffprobe gives numbers as strings and leaves out (or writes N/A) what it does not know
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+def _rate(value):
+    # "30000/1001" -> 29.97..., "0/0" -> None
+    try:
+        rate = Fraction(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    return float(rate) if rate else None
+
+@dataclass(frozen=True)
+class StreamInfo:
+    index: int
+    codec_type: str
+    codec_name: str | None = None
+    width: int | None = None
+    height: int | None = None
+    pix_fmt: str | None = None
+    frame_rate: float | None = None
+    duration: float | None = None
+    bit_rate: int | None = None
+    sample_rate: int | None = None
+    channels: int | None = None
+    language: str | None = None
+    tags: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_ffprobe(cls, stream):
+        tags = stream.get('tags', {})
+        return cls(
+            index=stream['index'],
+            codec_type=stream.get('codec_type', 'unknown'),
+            codec_name=stream.get('codec_name'),
+            width=_number(stream.get('width'), int),
+            height=_number(stream.get('height'), int),
+            pix_fmt=stream.get('pix_fmt'),
+            frame_rate=_rate(stream.get('avg_frame_rate')) or _rate(stream.get('r_frame_rate')),
+            duration=_number(stream.get('duration')),
+            bit_rate=_number(stream.get('bit_rate'), int),
+            sample_rate=_number(stream.get('sample_rate'), int),
+            channels=_number(stream.get('channels'), int),
+            language=tags.get('language'),
+            tags=tags,
+        )
+
+@dataclass(frozen=True)
+class FormatInfo:
+    filename: str
+    format_name: str | None = None
+    duration: float | None = None
+    size: int | None = None
+    bit_rate: int | None = None
+    tags: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_ffprobe(cls, fmt):
+        return cls(
+            filename=fmt.get('filename'),
+            format_name=fmt.get('format_name'),
+            duration=_number(fmt.get('duration')),
+            size=_number(fmt.get('size'), int),
+            bit_rate=_number(fmt.get('bit_rate'), int),
+            tags=fmt.get('tags', {}),
+        )
+
+@dataclass(frozen=True)
+class MediaInfo:
+    path: str
+    format: FormatInfo
+    streams: tuple
+
+    @classmethod
+    def from_ffprobe(cls, path, data):
+        return cls(
+            path=path,
+            format=FormatInfo.from_ffprobe(data.get('format', {})),
+            streams=tuple(StreamInfo.from_ffprobe(s) for s in data.get('streams', [])),
+        )
+
+    def streams_of_type(self, codec_type):
+        return [s for s in self.streams if s.codec_type == codec_type]
+
+    @property
+    def video(self):
+        """
+        First video stream, or None.
+        """
+        video_streams = self.streams_of_type('video')
+        return video_streams[0] if video_streams else None
+
+    @property
+    def duration(self):
+        """
+        Duration of the first video stream, falling back to the container duration.
+        """
+        video = self.video
+        return video.duration if video and video.duration is not None else self.format.duration
+
+    def track_counts(self):
+        """
+        Number of streams of every type, e.g. {'video': 1, 'audio': 2}.
+        """
+        counts = {}
+        for stream in self.streams:
+            counts[stream.codec_type] = counts.get(stream.codec_type, 0) + 1
+        return counts
+
+class ProbeCache:
+    """
+    Persistent ffprobe results (raw JSON) keyed by path, size and mtime, in SQLite.
+    A file that changed gets a new key, so stale entries are never returned.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS probes '
+                               '(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, data TEXT)')
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # one short connection per call, so several threads can use the cache. Closed
+        # afterwards: `with connection` alone only commits
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get(self, path, stat):
+        with self._connect() as connection:
+            row = connection.execute('SELECT data FROM probes WHERE path = ? AND size = ? AND mtime_ns = ?',
+                                     (path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, path, stat, data):
+        with self._connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?)',
+                               (path, stat.st_size, stat.st_mtime_ns, json.dumps(data)))
+
+    def prune(self):
+        """
+        Drop the entries of files that were deleted or changed since they were probed.
+
+        Returns:
+            int: Number of entries removed.
+        """
+        with self._connect() as connection:
+            rows = connection.execute('SELECT path, size, mtime_ns FROM probes').fetchall()
+        stale = []
+        for path, size, mtime_ns in rows:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stale.append((path,))
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                stale.append((path,))
+        with self._connect() as connection:
+            connection.executemany('DELETE FROM probes WHERE path = ?', stale)
+        return len(stale)
+
+def run_ffprobe(path):
+    """
+    Run ffprobe once on a file and return its JSON output (all streams and the format).
+    """
+    command = ['ffprobe', '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', path]
+    result = run_command(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise ProbeError(f"ffprobe failed on {path}: {result.stderr.strip()}")
+    return json.loads(result.stdout)
+
+def probe(path, cache=True):
+    """
+    Read all the stream and container information of a media file.
+
+    Args:
+        path (str): Path to the media file.
+        cache (bool or ProbeCache): Use the default persistent cache (True), a specific
+            one, or none (False).
+
+    Returns:
+        MediaInfo: Streams and format of the file.
+    """
+    path = os.path.abspath(path)
+    if cache is True:
+        cache = ProbeCache()
+    stat = os.stat(path)
+
+    data = cache.get(path, stat) if cache else None
+    if data is None:
+        data = run_ffprobe(path)
+        if cache:
+            cache.put(path, stat, data)
+    return MediaInfo.from_ffprobe(path, data)
+
+def probe_directory(directory, extensions=MEDIA_EXTENSIONS, recursive=True, workers=8, cache=True):
+    """
+    Probe every media file of a directory, several ffprobe processes at a time.
+    Files that did not change since the last scan come from the cache.
+
+    Args:
+        directory (str): Directory to scan.
+        extensions (tuple): File extensions to probe (lowercase).
+        recursive (bool): Also scan subdirectories.
+        workers (int): ffprobe processes running at the same time.
+        cache (bool or ProbeCache): Same as in probe.
+
+    Returns:
+        tuple: ({path: MediaInfo}, {path: error message}) for the files that worked and failed.
+    """
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        paths += [os.path.join(root, name) for name in sorted(files) if name.lower().endswith(extensions)]
+        if not recursive:
+            break
+    if cache is True:
+        cache = ProbeCache()
+
+    def probe_one(path):
+        try:
+            return path, probe(path, cache), None
+        except (ProbeError, OSError, ValueError) as e:
+            return path, None, str(e)
+
+    infos, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for path, info, error in pool.map(probe_one, paths):
+            if error is None:
+                infos[path] = info
+            else:
+                errors[path] = error
+    return infos, errors
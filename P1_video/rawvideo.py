@@ -0,0 +1,225 @@
+import subprocess
+import tempfile
+import numpy as np
+
+from .probe import probe
+
+# Planes of every supported pixel format: (height divisor, width divisor, channels, dtype)
+PIXEL_FORMATS = {
+    'gray': [(1, 1, 1, np.uint8)],
+    'gray16le': [(1, 1, 1, np.dtype('<u2'))],
+    'rgb24': [(1, 1, 3, np.uint8)],
+    'bgr24': [(1, 1, 3, np.uint8)],
+    'rgba': [(1, 1, 4, np.uint8)],
+    'yuv444p': [(1, 1, 1, np.uint8)] * 3,
+    'yuv422p': [(1, 1, 1, np.uint8), (1, 2, 1, np.uint8), (1, 2, 1, np.uint8)],
+    'yuv420p': [(1, 1, 1, np.uint8), (2, 2, 1, np.uint8), (2, 2, 1, np.uint8)],
+}
+
+def frame_layout(pix_fmt, width, height):
+    """
+    Shape and dtype of every plane of a raw frame.
+
+    Args:
+        pix_fmt (str): ffmpeg pixel format, one of PIXEL_FORMATS.
+        width (int): Frame width in pixels.
+        height (int): Frame height in pixels.
+
+    Returns:
+        list: (shape, dtype) per plane. Packed formats have a single (H, W, C) plane,
+        gray ones a single (H, W) plane.
+    """
+    if pix_fmt not in PIXEL_FORMATS:
+        raise ValueError(f"Unsupported pixel format '{pix_fmt}', use one of {sorted(PIXEL_FORMATS)}")
+    layout = []
+    for h_div, w_div, channels, dtype in PIXEL_FORMATS[pix_fmt]:
+        shape = (-(-height // h_div), -(-width // w_div))
+        if channels > 1:
+            shape += (channels,)
+        layout.append((shape, np.dtype(dtype)))
+    return layout
+
+def frame_size(pix_fmt, width, height):
+    """
+    Bytes taken by one raw frame.
+    """
+    return sum(int(np.prod(shape)) * dtype.itemsize for shape, dtype in frame_layout(pix_fmt, width, height))
+
+def _frame_views(buffer, pix_fmt, width, height):
+    # NumPy views of every plane over a flat byte buffer
+    views, offset = [], 0
+    for shape, dtype in frame_layout(pix_fmt, width, height):
+        count = int(np.prod(shape))
+        views.append(np.frombuffer(buffer, dtype=dtype, count=count, offset=offset).reshape(shape))
+        offset += count * dtype.itemsize
+    return views[0] if len(views) == 1 else tuple(views)
+
+def probe_size(input_video):
+    """
+    Width and height of the first video stream (probed once, then cached).
+
+    Returns:
+        tuple: (width, height).
+    """
+    video = probe(input_video).video
+    if video is None:
+        raise ValueError(f"{input_video} has no video stream")
+    return video.width, video.height
+
+def _read_errors(errors):
+    # what ffmpeg logged into a temporary stderr file, read once it has exited
+    errors.seek(0)
+    return errors.read()
+
+def read_frames(input_video, width=None, height=None, pix_fmt='rgb24', buffers=2, input_args=(), filters=None,
+                output_args=()):
+    """
+    Decode a video with ffmpeg and yield its frames as NumPy arrays, through a pipe.
+
+    The frames are views over a small ring of reused buffers: a yielded frame is
+    only valid until `buffers` more frames have been read, copy it to keep it.
+
+    Args:
+        input_video (str): Path (or URL) of anything ffmpeg can decode.
+        width (int, optional): Output width. Defaults to the source width.
+        height (int, optional): Output height. Defaults to the source height.
+        pix_fmt (str): Pixel format of the yielded frames, one of PIXEL_FORMATS.
+        buffers (int): Number of frame buffers to cycle through.
+        input_args (list): Extra ffmpeg arguments before -i (e.g. ['-ss', '10']).
+        filters (str, optional): Extra video filters, applied before scaling.
+        output_args (list): Extra ffmpeg output options (e.g. ['-fps_mode', 'passthrough']
+            so frames dropped by a select filter are not duplicated back).
+
+    Yields:
+        np.array or tuple: The frame, or a (Y, U, V) tuple of planes for planar formats.
+    """
+    if width is None or height is None:
+        source_width, source_height = probe_size(input_video)
+        width, height = width or source_width, height or source_height
+
+    video_filters = [filters] if filters else []
+    video_filters.append(f'scale={width}:{height}')
+    command = ['ffmpeg', '-v', 'error', '-nostdin', *input_args, '-i', input_video,
+               '-map', '0:v:0', '-vf', ','.join(video_filters), *output_args,
+               '-f', 'rawvideo', '-pix_fmt', pix_fmt, '-']
+
+    size = frame_size(pix_fmt, width, height)
+    ring = [bytearray(size) for _ in range(buffers)]
+    views = [_frame_views(buffer, pix_fmt, width, height) for buffer in ring]
+
+    # stderr goes to a file: nobody reads a pipe while the frames stream, and a decoder
+    # logging a lot would fill it and block ffmpeg
+    errors = tempfile.TemporaryFile()
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors, bufsize=size)
+    except BaseException:
+        errors.close()
+        raise
+    try:
+        index = 0
+        while True:
+            target = memoryview(ring[index])
+            filled = 0
+            while filled < size:
+                read = process.stdout.readinto(target[filled:])
+                if not read:
+                    break
+                filled += read
+            if filled < size:
+                break
+            yield views[index]
+            index = (index + 1) % buffers
+
+        process.stdout.close()
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(process.returncode, command, stderr=_read_errors(errors))
+    finally:
+        # the caller stopped early (or something failed): do not leave ffmpeg running
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        errors.close()
+
+class FrameWriter:
+    """
+    Stream raw NumPy frames into an ffmpeg encoder.
+
+    Use it as a context manager:
+
+        with FrameWriter('out.mp4', 640, 360, ['-c:v', 'libx264']) as writer:
+            for frame in frames:
+                writer.write(frame)
+    """
+
+    def __init__(self, output_video, width, height, output_args=(), pix_fmt='rgb24', framerate=25):
+        """
+        Args:
+            output_video (str): Path of the encoded output.
+            width (int): Frame width in pixels.
+            height (int): Frame height in pixels.
+            output_args (list): ffmpeg output options (codec, quality, ...).
+            pix_fmt (str): Pixel format of the frames that will be written.
+            framerate (float): Frame rate of the output.
+        """
+        self.width = width
+        self.height = height
+        self.pix_fmt = pix_fmt
+        self.size = frame_size(pix_fmt, width, height)
+        self.command = ['ffmpeg', '-v', 'error', '-y',
+                        '-f', 'rawvideo', '-pix_fmt', pix_fmt, '-s', f'{width}x{height}', '-r', str(framerate),
+                        '-i', '-', *output_args, output_video]
+        # stderr goes to a file, read after the encode (see read_frames)
+        self.errors = tempfile.TemporaryFile()
+        try:
+            self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stderr=self.errors)
+        except BaseException:
+            self.errors.close()
+            raise
+
+    def write(self, frame):
+        """
+        Send one frame: an array (or a tuple of planes) laid out as pix_fmt.
+        """
+        planes = frame if isinstance(frame, tuple) else (frame,)
+        size = sum(plane.nbytes for plane in planes)
+        if size != self.size:
+            raise ValueError(f"Expected {self.size} bytes per {self.pix_fmt} frame, got {size}")
+        for plane in planes:
+            self.process.stdin.write(memoryview(np.ascontiguousarray(plane)).cast('B'))
+
+    def close(self):
+        """
+        Finish the encode and wait for ffmpeg.
+        """
+        if self.process.stdin and not self.process.stdin.closed:
+            self.process.stdin.close()
+        self.process.wait()
+        stderr = _read_errors(self.errors)
+        self.errors.close()
+        if self.process.returncode != 0:
+            raise subprocess.CalledProcessError(self.process.returncode, self.command, stderr=stderr)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            # do not let ffmpeg finish a half written file
+            self.process.kill()
+            self.process.wait()
+            self.process.stdin.close()
+            self.errors.close()
+            return False
+        self.close()
+        return False
+
+
+'''
+# Convert a video to YUV and back frame by frame, without intermediate files
+from P1_video.main import rgb_to_yuv_frame, yuv_to_rgb_frame
+
+with FrameWriter('roundtrip.mp4', 640, 360, ['-c:v', 'libx264']) as writer:
+    for frame in read_frames('../P2_video/badbunny10.mp4', 640, 360):
+        writer.write(yuv_to_rgb_frame(rgb_to_yuv_frame(frame)))
+'''
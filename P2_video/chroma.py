@@ -0,0 +1,208 @@
+import numpy as np
+
+# Chroma subsampling factors of every format: (height divisor, width divisor)
+CHROMA_FORMATS = {
+    '444': (1, 1),
+    '422': (1, 2),
+    '420': (2, 2),
+}
+
+METHODS = ('box', 'bilinear')
+
+def _format(name):
+    # accept '4:2:0', '420' and 'yuv420p'
+    key = name.replace(':', '').replace('yuv', '').rstrip('p')
+    if key not in CHROMA_FORMATS:
+        raise ValueError(f"Unknown chroma format '{name}', use one of {sorted(CHROMA_FORMATS)}")
+    return key
+
+def chroma_shape(chroma_format, height, width):
+    """
+    Height and width of the U and V planes of a height x width frame.
+    """
+    h_div, w_div = CHROMA_FORMATS[_format(chroma_format)]
+    return -(-height // h_div), -(-width // w_div)
+
+def planar_views(buffer, chroma_format, width, height, frames=1):
+    """
+    Y, U and V views over a buffer of planar 8-bit frames (e.g. the bytes of a
+    yuv420p rawvideo file), without copying: writing into the views writes the buffer.
+
+    Args:
+        buffer: bytearray, NumPy array or anything else exposing the buffer protocol.
+        chroma_format (str): Format of the frames in the buffer.
+        width (int): Frame width in pixels.
+        height (int): Frame height in pixels.
+        frames (int): Frames stored one after the other in the buffer.
+
+    Returns:
+        tuple: (Y, U, V) arrays of shape (frames, h, w).
+    """
+    chroma_height, chroma_width = chroma_shape(chroma_format, height, width)
+    sizes = [height * width, chroma_height * chroma_width, chroma_height * chroma_width]
+    data = np.frombuffer(buffer, dtype=np.uint8, count=frames * sum(sizes)).reshape(frames, sum(sizes))
+    shapes = [(height, width), (chroma_height, chroma_width), (chroma_height, chroma_width)]
+    views, offset = [], 0
+    for size, shape in zip(sizes, shapes):
+        views.append(data[:, offset:offset + size].reshape(frames, *shape))
+        offset += size
+    return tuple(views)
+
+def _downsample_2x(plane, method):
+    """
+    Halve the last axis. box averages every pair of samples, bilinear uses the
+    wider [1, 3, 3, 1] / 8 kernel (the edges are repeated).
+    """
+    if plane.shape[-1] % 2:
+        plane = np.concatenate([plane, plane[..., -1:]], axis=-1)
+    even, odd = plane[..., 0::2], plane[..., 1::2]
+    if method == 'box':
+        return (even + odd) * 0.5
+    previous = np.concatenate([even[..., :1], odd[..., :-1]], axis=-1)
+    following = np.concatenate([even[..., 1:], odd[..., -1:]], axis=-1)
+    return (previous + following + 3 * (even + odd)) * 0.125
+
+def _upsample_2x(plane, size, method):
+    """
+    Double the last axis and crop it to size. box repeats every sample, bilinear
+    interpolates between the neighbours (3/4 of the nearest, 1/4 of the next one).
+    """
+    if method == 'box':
+        return np.repeat(plane, 2, axis=-1)[..., :size]
+    previous = np.concatenate([plane[..., :1], plane[..., :-1]], axis=-1)
+    following = np.concatenate([plane[..., 1:], plane[..., -1:]], axis=-1)
+    upsampled = np.stack([0.75 * plane + 0.25 * previous, 0.75 * plane + 0.25 * following], axis=-1)
+    return upsampled.reshape(*plane.shape[:-1], 2 * plane.shape[-1])[..., :size]
+
+def resample_chroma(plane, source_format, target_format, height, width, method='box'):
+    """
+    Resample one chroma plane (or a stack of them) between two formats, as float32.
+
+    Args:
+        plane (np.array): (..., h, w) chroma plane in source_format.
+        source_format (str): Format of the plane, '444', '422' or '420'.
+        target_format (str): Format wanted.
+        height (int): Height of the luma plane.
+        width (int): Width of the luma plane.
+        method (str): 'box' or 'bilinear'.
+
+    Returns:
+        np.array: (..., h, w) plane in target_format.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method '{method}', use one of {METHODS}")
+    source = CHROMA_FORMATS[_format(source_format)]
+    target = CHROMA_FORMATS[_format(target_format)]
+    target_shape = chroma_shape(target_format, height, width)
+
+    result = plane.astype(np.float32, copy=False)
+    # every axis is independent: halve, double or leave it
+    for axis, (source_div, target_div, size) in enumerate(zip(source, target, target_shape)):
+        if source_div == target_div:
+            continue
+        result = np.swapaxes(result, -2 + axis, -1)
+        if target_div > source_div:
+            result = _downsample_2x(result, method)
+        else:
+            result = _upsample_2x(result, size, method)
+        result = np.swapaxes(result, -2 + axis, -1)
+    return result
+
+def _store(values, out):
+    # round, clip to the integer range of out and write it in place
+    if np.issubdtype(out.dtype, np.integer):
+        info = np.iinfo(out.dtype)
+        values = np.clip(np.rint(values), info.min, info.max)
+    out[...] = values
+    return out
+
+def convert_chroma(planes, source_format, target_format, method='box', out=None):
+    """
+    Convert planar YUV frames between 4:4:4, 4:2:2 and 4:2:0.
+
+    Works on single frames (h, w) and on stacks (frames, h, w) alike. With out,
+    the result is written into existing planes (e.g. planar_views of a buffer)
+    instead of new arrays.
+
+    Args:
+        planes (tuple): (Y, U, V) arrays in source_format.
+        source_format (str): '444', '422' or '420' (also '4:2:0' or 'yuv420p').
+        target_format (str): Format to convert to.
+        method (str): 'box' or 'bilinear' filter.
+        out (tuple, optional): (Y, U, V) arrays of the target format to write into.
+
+    Returns:
+        tuple: (Y, U, V) in target_format, with the dtype of the input (or of out).
+    """
+    y, u, v = planes
+    height, width = y.shape[-2:]
+    if out is None:
+        shape = y.shape[:-2] + chroma_shape(target_format, height, width)
+        out = (y.copy(), np.empty(shape, dtype=u.dtype), np.empty(shape, dtype=v.dtype))
+    elif not np.shares_memory(out[0], y):
+        out[0][...] = y
+
+    for plane, target in zip((u, v), out[1:]):
+        _store(resample_chroma(plane, source_format, target_format, height, width, method), target)
+    return out
+
+def psnr(reference, test, peak=255):
+    """
+    PSNR in dB of test against reference over the last two axes, so a stack of
+    planes gives one value per frame. Identical planes give inf.
+    """
+    error = reference.astype(np.float32) - test.astype(np.float32)
+    mse = np.mean(error * error, axis=(-2, -1))
+    with np.errstate(divide='ignore'):
+        return 10 * np.log10(peak * peak / mse)
+
+def subsampling_psnr(planes, chroma_format, method='box', upsample_method=None):
+    """
+    What subsampling 4:4:4 frames to chroma_format costs: the chroma is subsampled,
+    brought back to 4:4:4 and compared with the original.
+
+    Args:
+        planes (tuple): (Y, U, V) 4:4:4 frames, single or stacked.
+        chroma_format (str): Format to try, e.g. '420'.
+        method (str): Filter used to subsample.
+        upsample_method (str, optional): Filter used to upsample. Defaults to method.
+
+    Returns:
+        dict: PSNR of 'u' and 'v' (one value per frame for stacks).
+    """
+    _, u, v = planes
+    height, width = u.shape[-2:]
+    result = {}
+    for name, plane in (('u', u), ('v', v)):
+        subsampled = _store(resample_chroma(plane, '444', chroma_format, height, width, method),
+                            np.empty(plane.shape[:-2] + chroma_shape(chroma_format, height, width), plane.dtype))
+        restored = resample_chroma(subsampled, chroma_format, '444', height, width, upsample_method or method)
+        result[name] = psnr(plane, _store(restored, np.empty_like(plane)))
+    return result
+
+def compare_subsampling(planes, formats=('422', '420'), methods=METHODS):
+    """
+    Mean chroma PSNR of every format and filter, to try them all on the same frames.
+
+    Returns:
+        dict: (format, method) -> (mean PSNR of U, mean PSNR of V).
+    """
+    results = {}
+    for chroma_format in formats:
+        for method in methods:
+            scores = subsampling_psnr(planes, chroma_format, method)
+            results[(chroma_format, method)] = (float(np.mean(scores['u'])), float(np.mean(scores['v'])))
+    return results
+
+
+'''
+# Try 4:2:2 and 4:2:0 with both filters on the first 50 frames, without encoding anything
+from P1_video.rawvideo import read_frames
+from itertools import islice
+
+frames = [tuple(plane.copy() for plane in yuv)
+          for yuv in islice(read_frames('badbunny10.mp4', pix_fmt='yuv444p'), 50)]
+stack = tuple(np.stack(plane) for plane in zip(*frames))
+for (chroma_format, method), (u, v) in compare_subsampling(stack).items():
+    print(f"{chroma_format} {method:<8} U {u:.2f} dB  V {v:.2f} dB")
+'''
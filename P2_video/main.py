@@ -1,13 +1,11 @@
 import subprocess
-import sys
-import os
-
-path_to_P1_video = os.path.abspath('/home/sebas/PycharmProjects')
-sys.path.append(path_to_P1_video)
+from collections import namedtuple
 
 # Import the 2 functions from 'main.py' in the 'P1_video' project
 from P1_video.main import rgb_to_yuv
 from P1_video.main import yuv_to_rgb
+from P1_video.probe import probe, ProbeError
+from P1_video.encode_cache import run_cached
 
 # create a 10s file to faster working
 # subprocess.run('ffmpeg -i BadBunny.mp4 -t 10 -c:v copy -c:a copy badbunny10.mp4', shell=True)
@@ -23,55 +21,122 @@ def change_resolution(input_video, output_video, width, height):
         height (int): New height of the video.
 
     Returns:
-        None
+        bool: True if the video was written.
     """
-    resize_command = f'ffmpeg -i "{input_video}" -vf "scale={width}:{height}" -c:a copy "{output_video}"'
-
     try:
-        subprocess.run(resize_command, shell=True, check=True)
+        run_cached(change_resolution_command(input_video, output_video, width, height), [output_video], check=True)
         print(f"Video resolution changed to {width}x{height}.")
+        return True
+    except subprocess.CalledProcessError as e:
+        print(f"Error: {e}")
+        return False
+
+def change_resolution_command(input_video, output_video, width, height):
+    # ffmpeg command of change_resolution, as an argument list
+    return ['ffmpeg', '-i', input_video, '-vf', f'scale={width}:{height}', '-c:a', 'copy', output_video]
+
+# One output of a resolution ladder. output_args are extra ffmpeg output options (codec, bitrate, ...)
+Rendition = namedtuple('Rendition', ['output_video', 'width', 'height', 'output_args'], defaults=[()])
+
+def ladder_command(input_video, renditions):
+    """
+    ffmpeg command that decodes input_video once and writes every rendition:
+    the decoded video is split, each branch scaled and sent to its own encoder.
+
+    Args:
+        input_video (str): Path to the input video file.
+        renditions (list): Rendition tuples (output_video, width, height, output_args).
+
+    Returns:
+        list: The ffmpeg command as an argument list.
+    """
+    branches = ''.join(f'[v{i}]' for i in range(len(renditions)))
+    graph = [f'[0:v]split={len(renditions)}{branches}']
+    for i, rendition in enumerate(renditions):
+        graph.append(f'[v{i}]scale={rendition.width}:{rendition.height}[out{i}]')
+
+    command = ['ffmpeg', '-i', input_video, '-filter_complex', ';'.join(graph)]
+    for i, rendition in enumerate(renditions):
+        # same as change_resolution: audio copied, everything else up to the rendition
+        command += ['-map', f'[out{i}]', '-map', '0:a?', '-c:a', 'copy', *rendition.output_args, rendition.output_video]
+    return command
+
+def change_resolution_ladder(input_video, renditions):
+    """
+    Change the resolution of a video to several sizes with a single decode.
+
+    Args:
+        input_video (str): Path to the input video file.
+        renditions (list): Rendition tuples (output_video, width, height, output_args),
+            or plain (output_video, width, height) tuples.
+
+    Returns:
+        bool: True if every rendition was written.
+    """
+    renditions = [Rendition(*r) for r in renditions]
+    try:
+        run_cached(ladder_command(input_video, renditions), [r.output_video for r in renditions], check=True)
+        sizes = ', '.join(f'{r.width}x{r.height}' for r in renditions)
+        print(f"Video resolution changed to {sizes}.")
+        return True
     except subprocess.CalledProcessError as e:
         print(f"Error: {e}")
+        return False
 
 def change_chroma_subsampling(input_video, output_video):
     """
-    Change the chroma subsampling of a video using ffmpeg.
+    Change the chroma subsampling of a video to 4:2:2 using ffmpeg (re-encodes it).
+    To compare formats without encoding, see chroma.compare_subsampling.
 
     Args:
         input_video (str): Path to the input video file.
         output_video (str): Path to the output video file.
 
     Returns:
-        None
+        bool: True if the video was written.
     """
-    subsampling_command = f'ffmpeg -i "{input_video}" -vf "format=yuv422p" -c:v libx264 -c:a copy "{output_video}"'
-
     try:
-        subprocess.run(subsampling_command, shell=True, check=True)
-        print(f"Chroma subsampling changed to 4:2:0.")
+        run_cached(chroma_subsampling_command(input_video, output_video), [output_video], check=True)
+        print("Chroma subsampling changed to 4:2:2.")
+        return True
     except subprocess.CalledProcessError as e:
         print(f"Error: {e}")
+        return False
+
+def chroma_subsampling_command(input_video, output_video):
+    # ffmpeg command of change_chroma_subsampling, as an argument list
+    return ['ffmpeg', '-i', input_video, '-vf', 'format=yuv422p', '-c:v', 'libx264', '-c:a', 'copy', output_video]
 
 def get_video_info(video_file):
-    try:
-        # Run FFprobe to get video information
-        info_command = f'ffprobe -v error -select_streams v:0 -show_entries stream=width,height,duration,r_frame_rate,codec_name -of default=noprint_wrappers=1:nokey=1 "{video_file}"'
-        info_output = subprocess.check_output(info_command, shell=True, text=True)
+    """
+    Print the main properties of the first video stream of a file.
+
+    Args:
+        video_file (str): Path to the video file.
 
-        # Parse the output to get relevant data
-        data = info_output.strip().split('\n')
-        codec_name, width, height, frame_rate, duration = data
+    Returns:
+        MediaInfo: Everything ffprobe knows about the file (all streams and the container),
+        or None if it could not be read.
+    """
+    try:
+        # One FFprobe call (JSON, cached between runs) gives every stream and the container
+        info = probe(video_file)
+        video = info.video
+        if video is None:
+            print(f"Error: {video_file} has no video stream")
+            return info
 
         # Print the relevant data
         print(f"Video File: {video_file}")
-        print(f"Resolution: {width}x{height}")
-        print(f"Duration: {duration} s")
-        print(f"Frame Rate: {frame_rate} fps")
-        print(f"Codec Name: {codec_name}")
+        print(f"Resolution: {video.width}x{video.height}")
+        print(f"Duration: {info.duration} s")
+        print(f"Frame Rate: {video.frame_rate} fps")
+        print(f"Codec Name: {video.codec_name}")
+        return info
 
-    except subprocess.CalledProcessError as e:
+    except (ProbeError, OSError) as e:
         print(f"Error: {e}")
-        print(f"Error code: {e.returncode}")
+        return None
 
 
 '''
@@ -92,6 +157,16 @@ new_height = 360
 change_resolution(input_video, output_video, new_width, new_height)
 '''
 '''
+# Ex2 with several sizes from one decode
+input_video = "badbunny10.mp4"
+renditions = [
+    Rendition("BadBunny_360p.mp4", 640, 360),
+    Rendition("BadBunny_180p.mp4", 320, 180, ['-crf', '28']),
+]
+
+change_resolution_ladder(input_video, renditions)
+'''
+'''
 # Ex3
 input_video = "badbunny10.mp4"
 output_video = "BBBsubsampling.mp4"
@@ -1,10 +1,12 @@
 import subprocess
 
+from P1_video.jobs import run_command
+
 def download_subtitles(video_url, output_file):
     try:
         # Run youtube-dl command to download subtitles
         command = ['youtube-dl', '--write-sub', '--sub-lang', 'en', '-o', output_file, video_url]
-        subprocess.run(command, check=True)
+        run_command(command, check=True)
 
         return output_file
     except subprocess.CalledProcessError as e:
@@ -16,6 +18,8 @@ def download_subtitles(video_url, output_file):
 # but could not convert it into a format that works, the txt that i did
 # does not work with my ffmpeg call
 
+from youtube_transcript_api import YouTubeTranscriptApi  # pip install codificacio-video[youtube]
+
 srt = YouTubeTranscriptApi.get_transcript("kLpH1nSLJSs")
 
 # creating or overwriting a file "subtitles.txt" with
@@ -39,7 +43,7 @@ def integrate_subtitles(video_file, subtitles_file, output_file):
             output_file
         ]
 
-        subprocess.run(command, check=True)
+        run_command(command, check=True)
 
     except subprocess.CalledProcessError as e:
         print(f"Error during subtitle integration:\n{e}")
@@ -1,23 +1,113 @@
 import subprocess
+import numpy as np
 
-def extract_yuv_histogram(input_video, histogram_file):
-    try:
-        # Run FFmpeg command to extract YUV histogram
-        command = [
-            'ffmpeg',
-            '-i', input_video,
-            '-vf', 'split=2[a][b],[b]histogram,format=yuva444p[hh],[a][hh]overlay',
-            '-vcodec', 'libx264',
-            '-preset', 'ultrafast',
-            '-y',
-            histogram_file
-        ]
+from P1_video.jobs import run_command
+from P1_video.rawvideo import read_frames
+
+def yuv_histograms(input_video, every=1, window=1):
+    """
+    Y, U and V histograms of a video, computed from the decoded planes without encoding anything.
+
+    The frames are streamed as yuv420p from ffmpeg. Frames that are not sampled
+    are dropped by ffmpeg's select filter, so they are never piped or counted.
+    Counts are uint32, enough for windows of up to ~4 billion pixels.
+
+    Args:
+        input_video (str): Path to the input video file.
+        every (int): Use only every Nth frame (1 = all of them).
+        window (int): Sampled frames summed into each histogram (1 = one per frame).
+
+    Returns:
+        dict: 'y', 'u', 'v' arrays of shape (histograms, 256) and 'frames', the index
+        of the first source frame of every histogram.
+    """
+    filters = f'select=not(mod(n\\,{every}))' if every > 1 else None
+    planes = {'y': [], 'u': [], 'v': []}
+    frames = []
+    # running sums of the current window
+    window_sums = np.zeros((3, 256), dtype=np.uint32)
+    in_window = 0
+
+    # passthrough: keep only the selected frames instead of filling the gaps to a constant frame rate
+    for sample, yuv in enumerate(read_frames(input_video, pix_fmt='yuv420p', filters=filters,
+                                             output_args=['-fps_mode', 'passthrough'])):
+        if in_window == 0:
+            frames.append(sample * every)
+        for i, plane in enumerate(yuv):
+            window_sums[i] += np.bincount(plane.ravel(), minlength=256).astype(np.uint32)
+        in_window += 1
+        if in_window == window:
+            for i, name in enumerate(planes):
+                planes[name].append(window_sums[i].copy())
+            window_sums[:] = 0
+            in_window = 0
+
+    # last, shorter window
+    if in_window:
+        for i, name in enumerate(planes):
+            planes[name].append(window_sums[i].copy())
+
+    result = {name: np.array(rows, dtype=np.uint32).reshape(-1, 256) for name, rows in planes.items()}
+    result['frames'] = np.array(frames, dtype=np.uint32)
+    return result
 
-        subprocess.run(command, check=True)
+def save_yuv_histograms(histograms, data_file, every=1, window=1):
+    """
+    Store the output of yuv_histograms as compressed NumPy arrays (.npz), one per plane.
+    """
+    np.savez_compressed(data_file, every=every, window=window, **histograms)
+
+def render_yuv_histogram(input_video, histogram_file):
+    """
+    Draw the YUV histogram over the video (full libx264 encode).
+
+    Raises subprocess.CalledProcessError if ffmpeg fails.
+    """
+    # Run FFmpeg command to extract YUV histogram
+    command = [
+        'ffmpeg',
+        '-i', input_video,
+        '-vf', 'split=2[a][b],[b]histogram,format=yuva444p[hh],[a][hh]overlay',
+        '-vcodec', 'libx264',
+        '-preset', 'ultrafast',
+        '-y',
+        histogram_file
+    ]
+
+    run_command(command, check=True)
+
+def extract_yuv_histogram(input_video, histogram_file=None, data_file=None, every=1, window=1):
+    """
+    Extract the YUV histograms of a video as numbers and/or as a rendered video.
+
+    Args:
+        input_video (str): Path to the input video file.
+        histogram_file (str, optional): Video with the histogram drawn over the
+            frames. Needs a full libx264 encode, leave it out for analysis only.
+        data_file (str, optional): .npz file for the numeric histograms.
+        every (int): Only analyze every Nth frame (numeric histograms only).
+        window (int): Sampled frames per histogram (numeric histograms only).
+
+    Returns:
+        dict: The output of yuv_histograms, computed when data_file is given or when
+        nothing else is asked for (no histogram_file). None otherwise or on errors.
+    """
+    histograms = None
+    try:
+        if data_file or not histogram_file:
+            histograms = yuv_histograms(input_video, every, window)
+        if data_file:
+            save_yuv_histograms(histograms, data_file, every, window)
+            print(f"YUV histograms saved successfully. Output file: {data_file}")
 
-        print(f"YUV histogram extracted successfully. Output file: {histogram_file}")
+        if histogram_file:
+            render_yuv_histogram(input_video, histogram_file)
+            print(f"YUV histogram extracted successfully. Output file: {histogram_file}")
 
     except subprocess.CalledProcessError as e:
         print(f"Error during YUV histogram extraction:\n{e}")
+        return None
     except Exception as e:
-        print(f"Unexpected error: {e}")
\ No newline at end of file
+        print(f"Unexpected error: {e}")
+        return None
+    return histograms
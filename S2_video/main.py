@@ -1,55 +1,250 @@
 import subprocess
 import os
-import sys
-from youtube_transcript_api import YouTubeTranscriptApi
-from pytube import YouTube
+
+from P1_video.lazy import lazy_import
+from P1_video.probe import probe, ProbeError
+from P1_video.jobs import run_command, stage
+from P1_video.encode_cache import run_cached
+
+# only the motion vector analysis needs NumPy
+np = lazy_import('numpy')
+
 # create a 9s file
 # subprocess.run('ffmpeg -i BadBunny.mp4 -t 9 -c:v copy -c:a copy badbunny9.mp4', shell=True)
 
+# One exported motion vector: frame index, reference direction (-1 past, 1 future),
+# block size, block center in the current frame and displacement in pixels
+# (MOTION_VECTOR_DTYPE is the NumPy dtype, built on first use)
+MOTION_VECTOR_FIELDS = [('frame', '<u4'), ('source', 'i1'), ('w', 'u1'), ('h', 'u1'),
+                        ('x', '<i2'), ('y', '<i2'), ('dx', '<f4'), ('dy', '<f4')]
+# ffmpeg picture type codes (AVPictureType) used in frame_types
+PICTURE_TYPES = {0: '?', 1: 'I', 2: 'P', 3: 'B', 4: 'S', 5: 'SI', 6: 'SP', 7: 'BI'}
+
+def __getattr__(name):
+    if name == 'MOTION_VECTOR_DTYPE':
+        return np.dtype(MOTION_VECTOR_FIELDS)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 class VideoEditor:
-    def __init__(self, input_video, output_video):
+    def __init__(self, input_video, output_video=None):
         self.input_video = input_video
         self.output_video = output_video
 
-    def analyze_frames(self):
-        # Use FFmpeg with drawbox and minterpolate filters to show motion vectors
-        subprocess.run(['ffmpeg', '-flags2', '+export_mvs', '-i', self.input_video, '-vf', 'codecview=mv=pf+bf+bb', self.output_video])
+    def analyze_frames(self, data_file=None, render=True):
+        """
+        Motion vectors of the input: drawn on a re-encoded video and/or exported as data.
+
+        Args:
+            data_file (str, optional): .npz file for the vectors and motion_statistics
+                of every frame, decoded without encoding anything.
+            render (bool): Draw the vectors onto output_video (needs a full encode).
+
+        Returns:
+            bool: False if the render failed.
+        """
+        if render and self.output_video is None:
+            raise ValueError("Rendering needs an output_video")
+        if data_file:
+            data = self.motion_vectors()
+            np.savez_compressed(data_file, **data, **motion_statistics(data))
+        if render:
+            # Use FFmpeg with drawbox and minterpolate filters to show motion vectors
+            try:
+                run_cached(['ffmpeg', '-flags2', '+export_mvs', '-i', self.input_video, '-vf', 'codecview=mv=pf+bf+bb', self.output_video],
+                           [self.output_video], check=True)
+            except subprocess.CalledProcessError as e:
+                print(f"Error during motion vector rendering:\n{e}")
+                return False
+        return True
+
+    def motion_vectors(self):
+        """
+        Decode the input once and collect the motion vectors the decoder exports.
+
+        The ffmpeg command line has no way to dump this side data, so the frames are
+        decoded with PyAV (pip install av), with the same +export_mvs flag codecview
+        uses. Nothing is encoded and only one frame is kept in memory at a time.
+
+        Returns:
+            dict: 'vectors' (MOTION_VECTOR_DTYPE array, all frames), 'frame_types'
+            (PICTURE_TYPES codes), 'frame_times' (seconds) and 'size' (width, height).
+        """
+        import av
+
+        dtype = np.dtype(MOTION_VECTOR_FIELDS)
+        chunks, frame_types, frame_times = [], [], []
+        with av.open(self.input_video) as container:
+            stream = container.streams.video[0]
+            stream.codec_context.options = {'flags2': '+export_mvs'}
+            for index, frame in enumerate(container.decode(stream)):
+                frame_types.append(int(frame.pict_type))
+                frame_times.append(frame.time if frame.time is not None else np.nan)
+                side_data = frame.side_data.get('MOTION_VECTORS')
+                if side_data is None:
+                    # intra frames have no vectors
+                    continue
+                raw = side_data.to_ndarray()
+                vectors = np.empty(len(raw), dtype=dtype)
+                vectors['frame'] = index
+                vectors['source'] = np.sign(raw['source'])
+                vectors['w'], vectors['h'] = raw['w'], raw['h']
+                vectors['x'], vectors['y'] = raw['dst_x'], raw['dst_y']
+                scale = np.maximum(raw['motion_scale'], 1).astype(np.float32)
+                vectors['dx'] = raw['motion_x'] / scale
+                vectors['dy'] = raw['motion_y'] / scale
+                chunks.append(vectors)
+            size = (stream.codec_context.width, stream.codec_context.height)
+
+        return {
+            'vectors': np.concatenate(chunks) if chunks else np.empty(0, dtype=dtype),
+            'frame_types': np.array(frame_types, dtype=np.uint8),
+            'frame_times': np.array(frame_times, dtype=np.float64),
+            'size': np.array(size, dtype=np.uint32),
+        }
 
     def edit_video(self):
-        # Cut BBB into 50 seconds only video
-        subprocess.run(['ffmpeg', '-i', self.input_video, '-t', '50', '-c:v', 'copy', '-c:a', 'aac', 'temp.mp4'])
+        intermediates = ['temp.mp4', 'audio_mono.mp3', 'audio_stereo.mp3', 'audio_aac.aac']
+        try:
+            # Cut BBB into 50 seconds only video
+            with stage('edit: cut'):
+                run_command(['ffmpeg', '-i', self.input_video, '-t', '50', '-c:v', 'copy', '-c:a', 'aac', 'temp.mp4'])
 
-        # Export BBB(50s) audio as MP3 mono track
-        subprocess.run(['ffmpeg', '-i', 'temp.mp4', '-vn', '-ac', '1', 'audio_mono.mp3'])
+            # Export BBB(50s) audio as MP3 mono track
+            with stage('edit: mp3 mono'):
+                run_command(['ffmpeg', '-i', 'temp.mp4', '-vn', '-ac', '1', 'audio_mono.mp3'])
 
-        # Export BBB(50s) audio in MP3 stereo w/ lower bitrate
-        subprocess.run(['ffmpeg', '-i', 'temp.mp4', '-vn', '-b:a', '64k', 'audio_stereo.mp3'])
+            # Export BBB(50s) audio in MP3 stereo w/ lower bitrate
+            with stage('edit: mp3 stereo'):
+                run_command(['ffmpeg', '-i', 'temp.mp4', '-vn', '-b:a', '64k', 'audio_stereo.mp3'])
 
-        # Export BBB(50s) audio in AAC codec
-        subprocess.run(['ffmpeg', '-i', 'temp.mp4', '-vn', '-c:a', 'aac', 'audio_aac.aac'])
+            # Export BBB(50s) audio in AAC codec
+            with stage('edit: aac'):
+                run_command(['ffmpeg', '-i', 'temp.mp4', '-vn', '-c:a', 'aac', 'audio_aac.aac'])
 
-        # Package everything in a .mp4 with FFmpeg
-        subprocess.run(['ffmpeg', '-i', 'temp.mp4', '-i', 'audio_mono.mp3', '-i', 'audio_stereo.mp3', '-i', 'audio_aac.aac','-c:v', 'copy', '-c:a', 'aac', self.output_video])
+            # Package everything in a .mp4 with FFmpeg
+            with stage('edit: package'):
+                run_command(['ffmpeg', '-i', 'temp.mp4', '-i', 'audio_mono.mp3', '-i', 'audio_stereo.mp3', '-i', 'audio_aac.aac','-c:v', 'copy', '-c:a', 'aac', self.output_video])
 
-        # Clean up temporary files
-        subprocess.run(['rm', 'temp.mp4', 'audio_mono.mp3', 'audio_stereo.mp3', 'audio_aac.aac'])
+        finally:
+            # Clean up temporary files, also when a step failed
+            _remove_files(intermediates)
 
-def count_tracks(input_video):
-    try:
-        # Run ffprobe command to get information about the tracks
-        command = ['ffprobe', '-v', 'error', '-show_entries', 'stream=codec_type', '-of', 'default=noprint_wrappers=1:nokey=1', input_video]
-        result = subprocess.check_output(command, stderr=subprocess.STDOUT, text=True)
+    def edit_video_command(self, duration=50, audio_outputs=None):
+        """
+        Single ffmpeg command doing all of edit_video: cut, the three audio versions
+        and the final .mp4, decoding the input only once.
+
+        Like edit_video, the .mp4 gets the video (copied) and one AAC track. With
+        audio_outputs the audio is split in a filter graph, every version is encoded
+        once and the tee muxer writes the encoded streams into their own files, the
+        AAC one also into the .mp4.
+
+        Args:
+            duration (float): Seconds to keep from the start of the input.
+            audio_outputs (tuple, optional): Paths (mono mp3, stereo mp3, aac) to also
+                write the audio versions to. By default only the .mp4 is written.
+
+        Returns:
+            list: The ffmpeg command as an argument list.
+        """
+        command = ['ffmpeg', '-y', '-t', str(duration), '-i', self.input_video]
+        if audio_outputs is None:
+            return command + ['-map', '0:v:0', '-map', '0:a:0', '-c:v', 'copy', '-c:a', 'aac', self.output_video]
 
-        # Parse the output to count the different types of tracks
-        track_types = result.strip().split('\n')
+        mono, stereo, aac = audio_outputs
+        command += [
+            # aresample converts on its own, so the mono branch does not force asplit (and the others) to mono
+            '-filter_complex', '[0:a:0]asplit=3[a0][a1][a2];[a0]aresample,aformat=channel_layouts=mono[mono]',
+            '-map', '0:v:0', '-map', '[mono]', '-map', '[a1]', '-map', '[a2]',
+            '-c:v', 'copy',
+            '-c:a:0', 'libmp3lame',  # MP3 mono
+            '-c:a:1', 'libmp3lame', '-b:a:1', '64k',  # MP3 stereo w/ lower bitrate
+            '-c:a:2', 'aac',  # AAC, also the track of the .mp4
+        ]
+        slaves = [f"[select=\\'v:0,a:2\\':onfail=abort]{self.output_video}",
+                  f"[select=\\'a:0\\':f=mp3:onfail=abort]{mono}",
+                  f"[select=\\'a:1\\':f=mp3:onfail=abort]{stereo}",
+                  f"[select=\\'a:2\\':f=adts:onfail=abort]{aac}"]
+        return command + ['-f', 'tee', '|'.join(slaves)]
 
-        # Count the occurrences of each track type
-        track_counts = {track_type: track_types.count(track_type) for track_type in set(track_types)}
+    def edit_video_graph(self, duration=50, audio_outputs=None):
+        """
+        Same result as edit_video in one ffmpeg run, without temp.mp4 or any other
+        intermediate file. If ffmpeg fails, the half written outputs are removed.
 
-        return track_counts
+        Args:
+            duration (float): Seconds to keep from the start of the input.
+            audio_outputs (tuple, optional): Paths (mono mp3, stereo mp3, aac) to keep the
+                audio versions in, e.g. ('audio_mono.mp3', 'audio_stereo.mp3', 'audio_aac.aac').
 
-    except subprocess.CalledProcessError as e:
-        print(f"Error during ffprobe execution:\n{e.output}")
+        Returns:
+            bool: True if everything was written.
+        """
+        outputs = [self.output_video, *(audio_outputs or ())]
+        try:
+            run_cached(self.edit_video_command(duration, audio_outputs), outputs, check=True)
+            return True
+        except (subprocess.CalledProcessError, OSError) as e:
+            print(f"Error during video editing:\n{e}")
+            _remove_files(outputs)
+            return False
+
+def _remove_files(paths):
+    # Remove the files that exist, ignoring the ones that were never created
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def motion_statistics(data, moving_threshold=1.0):
+    """
+    Per frame summaries of the output of VideoEditor.motion_vectors.
+
+    Every vector counts with the area of its block, so a few big static blocks
+    weigh more than many small moving ones. A bi-predicted block has one vector
+    per reference, so shares are taken over the area the vectors cover (or the
+    frame, if that is larger: intra coded blocks do not move).
+
+    Args:
+        data (dict): Output of VideoEditor.motion_vectors.
+        moving_threshold (float): Displacement in pixels above which a block is moving.
+
+    Returns:
+        dict: Arrays with one value per frame:
+            'mean_motion': area weighted mean displacement of the predicted blocks,
+            'max_motion': largest displacement,
+            'moving_fraction': share of the predicted area that moves more than moving_threshold,
+            'activity': displacement per pixel of the frame, a scene activity score
+            (0 for intra frames, which have no vectors).
+    """
+    vectors = data['vectors']
+    frames = len(data['frame_types'])
+    width, height = (int(v) for v in data['size'])
+    index = vectors['frame'].astype(np.intp)
+    area = vectors['w'].astype(np.float64) * vectors['h']
+    magnitude = np.hypot(vectors['dx'], vectors['dy']).astype(np.float64)
+
+    covered = np.bincount(index, weights=area, minlength=frames)
+    weighted = np.bincount(index, weights=area * magnitude, minlength=frames)
+    moving = np.bincount(index, weights=area * (magnitude > moving_threshold), minlength=frames)
+    max_motion = np.zeros(frames)
+    np.maximum.at(max_motion, index, magnitude)
+
+    return {
+        'mean_motion': np.divide(weighted, covered, out=np.zeros(frames), where=covered > 0),
+        'max_motion': max_motion,
+        'moving_fraction': np.divide(moving, covered, out=np.zeros(frames), where=covered > 0),
+        'activity': weighted / np.maximum(covered, width * height),
+    }
+
+def count_tracks(input_video):
+    try:
+        # Same (cached) ffprobe call as the rest of the projects, it already lists every track
+        return probe(input_video).track_counts()
+
+    except ProbeError as e:
+        print(f"Error during ffprobe execution:\n{e}")
         return None
     except Exception as e:
         print(f"Unexpected error: {e}")
@@ -63,6 +258,9 @@ if __name__ == "__main__":
 
     analyzer = VideoEditor(input_video_path, output_video_path)
     analyzer.analyze_frames()
+
+    # Only the vectors and their statistics, no encode
+    analyzer.analyze_frames(data_file='motion_ex1.npz', render=False)
 '''
 
 ''' Ex2
@@ -74,6 +272,12 @@ if __name__ == "__main__":
     editor.edit_video()
 '''
 
+''' Ex2 in a single ffmpeg run, keeping the audio files too
+if __name__ == "__main__":
+    editor = VideoEditor('BadBunny.mp4', 'output_ex2.mp4')
+    editor.edit_video_graph(audio_outputs=('audio_mono.mp3', 'audio_stereo.mp3', 'audio_aac.aac'))
+'''
+
 '''Ex3
 input_video_path = "badbynny9.mp4" # downloaded another video with multiple tracks to check but deleted in the submission as it was too big to upload
 track_counts = count_tracks(input_video_path)
@@ -88,7 +292,7 @@ else:
 # As i could not make that function really work, a created another, ex5()
 
 # import the function
-from exercise4 import ex5
+from S2_video.exercise4 import ex5
 
 # Call the function from exercise4.py
 ex5()
@@ -96,11 +300,14 @@ ex5()
 
 '''Ex6
 # import the function
-from exercise6 import extract_yuv_histogram
+from S2_video.exercise6 import extract_yuv_histogram
 
 # Call the function from exercise6.py
 input_video = 'badbunny9.mp4'
 histogram_output_file = 'output_ex6.mp4'
 
 extract_yuv_histogram(input_video, histogram_output_file)
+
+# Only the numbers, one histogram per 10 frames using every 2nd frame, no encode
+extract_yuv_histogram(input_video, data_file='histograms_ex6.npz', every=2, window=5)
 '''
\ No newline at end of file
@@ -1,54 +1,259 @@
-import tkinter as tk
-from tkinter import filedialog
-import subprocess
+import asyncio
 import os
+import queue
+import subprocess
+import threading
+import tkinter as tk
+from tkinter import filedialog, messagebox, ttk
+
+from P1_video.jobs import JobRunner, Telemetry
+from P1_video.probe import probe, ProbeError
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.webm', '.mov', '.avi', '.ts')
+# How often the window picks up what the workers reported, in milliseconds
+POLL_INTERVAL = 100
+
+class ConversionQueue:
+    """
+    Runs ffmpeg jobs in the background so the Tk main loop never blocks.
+
+    The jobs run on an asyncio loop in a worker thread, through a JobRunner whose
+    budget is the number of workers: the rest wait their turn. Everything the
+    jobs report is put on `events`, a thread-safe queue the window reads from
+    its own thread, as tuples:
+
+        ('progress', job_id, fraction or None, out_time)
+        ('done', job_id, message)
+        ('failed', job_id, message)
+    """
+
+    def __init__(self, workers=None):
+        """
+        Args:
+            workers (int, optional): Jobs converting at the same time. Defaults to the number of cores.
+        """
+        self.events = queue.Queue()
+        self.runner = JobRunner(workers)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.futures = {}
+
+    def submit(self, job_id, command, input_video, output_file):
+        """
+        Queue a command writing output_file. Its progress is the share of input_video converted so far.
+        """
+        self.futures[job_id] = asyncio.run_coroutine_threadsafe(
+            self._run(job_id, command, input_video, output_file), self.loop)
+
+    async def _run(self, job_id, command, input_video, output_file):
+        # decided here and not from ffmpeg's exit code: -n refuses existing outputs, and
+        # anything found at output_file after a cancelled or failed run is then ours to remove
+        if os.path.exists(output_file):
+            self.events.put(('failed', job_id, "Skipped, output already exists"))
+            return
+        try:
+            # the duration turns ffmpeg's out_time into a fraction (probe is cached and blocking)
+            duration = await asyncio.to_thread(_duration, input_video)
+
+            def on_event(event):
+                # called on the worker thread, only the queue crosses to the window
+                if event['type'] == 'progress':
+                    fraction = 1.0 if event['done'] else None
+                    if not event['done'] and duration and event['out_time'] is not None:
+                        fraction = min(event['out_time'] / duration, 1.0)
+                    self.events.put(('progress', job_id, fraction, event['out_time']))
+
+            # progress comes through a pipe only POSIX can hand to ffmpeg: elsewhere the row
+            # only shows the result
+            telemetry = Telemetry(callback=on_event) if os.name == 'posix' else None
+            # cancelling the task kills ffmpeg, see JobRunner.run. One thread: only the audio
+            # is decoded, so every worker runs one job
+            result = await self.runner.run(command, threads=1, capture_output=True, text=True,
+                                           stdin=subprocess.DEVNULL, telemetry=telemetry, name=job_id)
+        except asyncio.CancelledError:
+            _remove_partial(output_file)
+            raise
+        except Exception as e:
+            # whatever went wrong, the row must not stay "Queued"
+            _remove_partial(output_file)
+            self.events.put(('failed', job_id, str(e) or type(e).__name__))
+            return
+        if result.returncode == 0:
+            self.events.put(('done', job_id, "Done"))
+        else:
+            _remove_partial(output_file)
+            # last line of ffmpeg's errors
+            lines = result.stderr.strip().splitlines()
+            self.events.put(('failed', job_id, lines[-1] if lines else f"ffmpeg exited with {result.returncode}"))
+
+    def cancel(self, job_id):
+        """
+        Cancel a job, queued or running (its ffmpeg is killed).
+
+        Returns:
+            bool: False if the job had already finished.
+        """
+        future = self.futures.get(job_id)
+        if future is None or future.done():
+            return False
+        future.cancel()
+        return True
+
+    def shutdown(self):
+        """
+        Cancel every job and stop the worker thread.
+        """
+        for job_id in list(self.futures):
+            self.cancel(job_id)
+        # give the cancelled jobs a moment to kill their processes
+        self.loop.call_soon_threadsafe(lambda: self.loop.call_later(0.5, self.loop.stop))
+        self.thread.join(timeout=2)
+
+def _duration(path):
+    # seconds of media in a file, None if ffprobe cannot tell
+    try:
+        return probe(path).duration
+    except (ProbeError, OSError, ValueError):
+        return None
+
+def _remove_partial(path):
+    # what a cancelled or failed ffmpeg left behind, so the next run does not skip the file
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
 
 class VideoToAudioConverter:
-    def __init__(self, master):
+    def __init__(self, master, workers=None):
         self.master = master
         self.master.title("Video to Audio Converter")
 
+        self.video_paths = []
         self.video_path = tk.StringVar()
         self.audio_format = tk.StringVar()
 
+        self.queue = ConversionQueue(workers)
+        # job id -> widgets of its row
+        self.jobs = {}
+        self.next_job = 0
+
         self.create_widgets()
+        self.master.protocol("WM_DELETE_WINDOW", self.close)
+        self.master.after(POLL_INTERVAL, self.poll_events)
 
     def create_widgets(self):
-        tk.Label(self.master, text="Select Video File:").grid(row=0, column=0, sticky="w", padx=10, pady=10)
+        tk.Label(self.master, text="Select Video Files:").grid(row=0, column=0, sticky="w", padx=10, pady=10)
         tk.Entry(self.master, textvariable=self.video_path, width=40, state="disabled").grid(row=0, column=1, padx=10, pady=10)
         tk.Button(self.master, text="Browse", command=self.browse_video).grid(row=0, column=2, padx=10, pady=10)
+        tk.Button(self.master, text="Folder", command=self.browse_folder).grid(row=0, column=3, padx=10, pady=10)
 
         tk.Label(self.master, text="Select Audio Format:").grid(row=1, column=0, sticky="w", padx=10, pady=10)
         tk.OptionMenu(self.master, self.audio_format, "mp2", "mp3", "wav").grid(row=1, column=1, padx=10, pady=10)
 
         tk.Button(self.master, text="Convert", command=self.convert_video).grid(row=2, column=1, pady=20)
 
+        # one row per queued file: name, progress bar, status and cancel button
+        self.jobs_frame = tk.Frame(self.master)
+        self.jobs_frame.grid(row=3, column=0, columnspan=4, sticky="we", padx=10, pady=10)
+
     def browse_video(self):
-        file_path = filedialog.askopenfilename(initialdir="C:\\Users\\Cakow\\PycharmProjects",
-                                              filetypes=(("video files", "*.mp4"),
-                                                         ("all files", "*.*")))
-        if file_path:
-            self.video_path.set(file_path)
+        file_paths = filedialog.askopenfilenames(initialdir="C:\\Users\\Cakow\\PycharmProjects",
+                                                 filetypes=(("video files", "*.mp4"),
+                                                            ("all files", "*.*")))
+        if file_paths:
+            self.set_videos(list(file_paths))
+
+    def browse_folder(self):
+        folder = filedialog.askdirectory(initialdir="C:\\Users\\Cakow\\PycharmProjects")
+        if folder:
+            self.set_videos([os.path.join(folder, name) for name in sorted(os.listdir(folder))
+                             if name.lower().endswith(VIDEO_EXTENSIONS)])
+
+    def set_videos(self, paths):
+        self.video_paths = paths
+        self.video_path.set(paths[0] if len(paths) == 1 else f"{len(paths)} files selected")
 
     def convert_video(self):
-        input_video = self.video_path.get()
         output_format = self.audio_format.get()
 
-        if not input_video:
-            tk.messagebox.showerror("Error", "Please select a video file.")
+        if not self.video_paths:
+            messagebox.showerror("Error", "Please select a video file.")
             return
 
         if not output_format:
-            tk.messagebox.showerror("Error", "Please select an audio format.")
+            messagebox.showerror("Error", "Please select an audio format.")
             return
 
-        output_file = os.path.join(os.path.dirname(input_video), "result." + output_format)
+        # every file gets its own job, the queue runs as many as it has workers for
+        for input_video in self.video_paths:
+            output_file = os.path.splitext(input_video)[0] + "." + output_format
+            # e.g. clip.mp4 and clip.mkv
+            queued = {job['output'] for job in self.jobs.values() if not job['finished']}
+            job_id = f"job{self.next_job}"
+            self.next_job += 1
+            self.add_job_row(job_id, output_file)
+            # never overwrite, whatever ffmpeg -n would exit with
+            if os.path.exists(output_file) or output_file in queued:
+                self.finish_job(job_id, "Skipped, output already exists")
+                continue
+            command = ["ffmpeg", "-n", "-i", input_video, "-q:a", "0", "-map", "a", output_file]
+            self.queue.submit(job_id, command, input_video, output_file)
 
-        try:
-            subprocess.run(["ffmpeg", "-i", input_video, "-q:a", "0", "-map", "a", output_file])
-            tk.messagebox.showinfo("Success", f"Conversion complete. Audio saved as 'result.{output_format}'")
-        except Exception as e:
-            tk.messagebox.showerror("Error", f"An error occurred: {str(e)}")
+    def add_job_row(self, job_id, output_file):
+        row = len(self.jobs)
+        name = os.path.basename(output_file)
+        status = tk.StringVar(value="Queued")
+        progress = ttk.Progressbar(self.jobs_frame, length=200, maximum=1.0)
+        cancel = tk.Button(self.jobs_frame, text="Cancel", command=lambda: self.cancel_job(job_id))
+        tk.Label(self.jobs_frame, text=name).grid(row=row, column=0, sticky="w")
+        progress.grid(row=row, column=1, padx=10)
+        tk.Label(self.jobs_frame, textvariable=status, width=30, anchor="w").grid(row=row, column=2, sticky="w")
+        cancel.grid(row=row, column=3)
+        self.jobs[job_id] = {'output': output_file, 'status': status, 'progress': progress, 'cancel': cancel,
+                             'finished': False}
+
+    def cancel_job(self, job_id):
+        if self.queue.cancel(job_id):
+            self.finish_job(job_id, "Cancelled")
+
+    def finish_job(self, job_id, message):
+        job = self.jobs[job_id]
+        job['finished'] = True
+        job['status'].set(message)
+        job['cancel'].config(state="disabled")
+
+    def poll_events(self):
+        # runs on the Tk thread: apply everything the workers reported since the last time
+        while True:
+            try:
+                event = self.queue.events.get_nowait()
+            except queue.Empty:
+                break
+            kind, job_id = event[:2]
+            job = self.jobs[job_id]
+            if job['finished']:
+                # e.g. progress that was on its way when the job got cancelled
+                continue
+            if kind == 'progress':
+                fraction, out_time = event[2:]
+                if fraction is not None:
+                    job['progress']['value'] = fraction
+                    job['status'].set(f"{fraction:.0%}")
+                elif out_time is not None:
+                    job['status'].set(f"{out_time:.1f} s converted")
+            else:
+                if kind == 'done':
+                    job['progress']['value'] = 1.0
+                self.finish_job(job_id, event[2])
+        self.master.after(POLL_INTERVAL, self.poll_events)
+
+    def close(self):
+        running = [job_id for job_id, job in self.jobs.items() if not job['finished']]
+        if running and not messagebox.askokcancel("Quit", f"Cancel {len(running)} unfinished conversions and quit?"):
+            return
+        self.queue.shutdown()
+        self.master.destroy()
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,295 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from P1_video.jobs import parse_progress, run_command, stage
+from P1_video.encode_cache import ffmpeg_version
+from .main import BUNNY_LADDER
+from .quality import compare_videos
+
+# Encoder of every codec of VideoConverter, the option its presets go through and
+# the presets and CRFs swept by default (every encoder has its own CRF scale)
+RDCodec = namedtuple('RDCodec', ['encoder', 'extension', 'preset_option', 'presets', 'crfs'])
+RD_CODECS = {
+    'vp8': RDCodec('libvpx', '.webm', '-cpu-used', ['8', '4'], [10, 20, 30]),
+    'vp9': RDCodec('libvpx-vp9', '.webm', '-cpu-used', ['4', '2'], [31, 37, 43]),
+    'h265': RDCodec('libx265', '.mp4', '-preset', ['veryfast', 'medium'], [24, 28, 32]),
+    'av1': RDCodec('libaom-av1', '.webm', '-cpu-used', ['6', '4'], [30, 38, 46]),
+}
+
+# The Bunny ladder of exercise 1, by name: '720p' -> (1280, 720)
+RESOLUTIONS = {f'{rendition.height}p': (rendition.width, rendition.height) for rendition in BUNNY_LADDER}
+
+# Lower bitrate, higher PSNR and faster encodes are better
+OBJECTIVES = (('bitrate_kbps', -1), ('psnr', 1), ('encode_fps', 1))
+
+def encoder_args(codec, preset, crf, threads=1):
+    """
+    ffmpeg output options of one point of the sweep, in constant quality mode.
+
+    Args:
+        codec (str): Key of RD_CODECS.
+        preset (str): Preset of the encoder (x265 preset name, or libvpx/libaom -cpu-used).
+        crf (int): Quality, on the encoder's own scale.
+        threads (int): Encoder threads.
+
+    Returns:
+        list: ffmpeg options.
+    """
+    encoder, _, preset_option, _, _ = RD_CODECS[codec]
+    args = ['-c:v', encoder, preset_option, str(preset), '-crf', str(crf)]
+    if codec == 'vp8':
+        # libvpx VP8 only honours -crf under a bitrate cap, make it high enough not to matter
+        args += ['-deadline', 'good', '-b:v', '50M']
+    elif codec in ('vp9', 'av1'):
+        args += ['-b:v', '0']
+        if codec == 'vp9':
+            args += ['-deadline', 'good']
+    else:
+        args += ['-x265-params', f'pools={threads}:log-level=error']
+    return args + ['-threads', str(threads)]
+
+def synthetic_source(output_video, seconds=2, width=1280, height=720, rate=25):
+    """
+    Test clip made by ffmpeg itself, so the sweep runs without any media: moving
+    test patterns plus temporal noise, which the encoders cannot predict for free.
+    Stored losslessly (FFV1).
+    """
+    command = ['ffmpeg', '-v', 'error', '-y', '-f', 'lavfi',
+               '-i', f'testsrc2=size={width}x{height}:rate={rate}:duration={seconds}',
+               '-vf', 'noise=alls=6:allf=t,format=yuv420p', '-c:v', 'ffv1', output_video]
+    run_command(command, check=True)
+
+def make_references(source, resolutions, workdir, seconds=None):
+    """
+    The source scaled to every resolution, as lossless yuv420p FFV1. Encodes
+    start from (and are scored against) these, so the PSNR measures the encoder
+    and not the scaler.
+
+    Returns:
+        dict: resolution name -> path.
+    """
+    references = {}
+    for name in resolutions:
+        width, height = RESOLUTIONS[name]
+        path = os.path.join(workdir, f'reference_{name}.mkv')
+        duration = ['-t', str(seconds)] if seconds else []
+        run_command(['ffmpeg', '-v', 'error', '-y', '-i', source, *duration, '-map', '0:v:0',
+                 '-vf', f'scale={width}:{height},format=yuv420p', '-c:v', 'ffv1', path], check=True)
+        references[name] = path
+    return references
+
+def measure_encode(command):
+    """
+    Run an ffmpeg command and measure it from the outside.
+
+    Wall time, CPU time and peak RSS of the ffmpeg process come from wait4, the
+    frames and the duration written from the end of its -progress output.
+
+    Returns:
+        dict: 'wall_time', 'cpu_time', 'peak_rss_mb', 'frames' and 'out_time'.
+    """
+    command = [command[0], '-progress', 'pipe:1', '-nostats', *command[1:]]
+    with tempfile.TemporaryFile() as errors:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors)
+        progress = process.stdout.read().decode(errors='replace')
+        process.stdout.close()
+        # wait4 instead of wait: the resource usage of this process alone
+        _, status, usage = os.wait4(process.pid, 0)
+        wall_time = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if process.returncode != 0:
+            errors.seek(0)
+            raise subprocess.CalledProcessError(process.returncode, command, stderr=errors.read())
+
+    # last complete block of key=value pairs
+    fields, last = {}, {}
+    for line in progress.splitlines():
+        key, _, value = line.strip().partition('=')
+        fields[key] = value
+        if key == 'progress':
+            last, fields = fields, {}
+    event = parse_progress(command[-1], last)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss_unit = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'wall_time': wall_time,
+        'cpu_time': usage.ru_utime + usage.ru_stime,
+        'peak_rss_mb': usage.ru_maxrss * rss_unit / 2 ** 20,
+        'frames': event.frame or 0,
+        'out_time': event.out_time or 0.0,
+    }
+
+def run_sweep(source, codecs=None, resolutions=None, presets=None, crfs=None, workdir=None, seconds=None,
+              threads=1, psnr_every=1, keep=False):
+    """
+    Encode the source with every codec x preset x CRF x resolution and measure each run.
+
+    Args:
+        source (str): Clip to encode (e.g. Bunny.mp4, or a synthetic_source).
+        codecs (list, optional): Keys of RD_CODECS. Defaults to all of them.
+        resolutions (list, optional): Keys of RESOLUTIONS. Defaults to all of them.
+        presets (dict, optional): codec -> presets, instead of the defaults of RD_CODECS.
+        crfs (dict, optional): codec -> CRFs, instead of the defaults of RD_CODECS.
+        workdir (str, optional): Where references and encodes go. Defaults to a temporary directory.
+        seconds (float, optional): Only use the start of the source.
+        threads (int): Threads of every encoder. 1 gives per-core speeds, what a
+            farm running one job per core gets.
+        psnr_every (int): Only score every Nth frame.
+        keep (bool): Keep the encodes in workdir (otherwise each is deleted once measured).
+
+    Returns:
+        list: One dict per run, with the settings and 'encode_fps', 'cpu_time',
+        'peak_rss_mb', 'bitrate_kbps', 'psnr' (Y, U and V weighted 4:1:1), ...
+    """
+    codecs = codecs or list(RD_CODECS)
+    resolutions = resolutions or list(RESOLUTIONS)
+    presets, crfs = presets or {}, crfs or {}
+    rows = []
+    with tempfile.TemporaryDirectory() as temporary:
+        workdir = workdir or temporary
+        os.makedirs(workdir, exist_ok=True)
+        with stage('rd: references'):
+            references = make_references(source, resolutions, workdir, seconds)
+
+        for resolution in resolutions:
+            width, height = RESOLUTIONS[resolution]
+            for codec in codecs:
+                settings = RD_CODECS[codec]
+                for preset in presets.get(codec, settings.presets):
+                    for crf in crfs.get(codec, settings.crfs):
+                        output = os.path.join(workdir, f'{codec}_{resolution}_{preset}_{crf}{settings.extension}')
+                        command = ['ffmpeg', '-v', 'error', '-y', '-nostdin', '-i', references[resolution],
+                                   *encoder_args(codec, preset, crf, threads), output]
+                        try:
+                            with stage(f'rd: {codec} {preset} crf {crf} @ {resolution}'):
+                                measured = measure_encode(command)
+                        except subprocess.CalledProcessError as e:
+                            print(f"Error encoding {codec} {preset} crf {crf} @ {resolution}: {e}")
+                            continue
+
+                        scores = compare_videos(references[resolution], {codec: output}, psnr_every,
+                                                width, height)[codec]
+                        psnr, ssim = scores['mean_psnr'], scores['mean_ssim']
+                        size = os.path.getsize(output)
+                        rows.append({
+                            'resolution': resolution, 'width': width, 'height': height,
+                            'codec': codec, 'preset': str(preset), 'crf': crf, 'threads': threads,
+                            'frames': measured['frames'],
+                            'encode_fps': measured['frames'] / measured['wall_time'],
+                            'wall_time': measured['wall_time'],
+                            'cpu_time': measured['cpu_time'],
+                            'peak_rss_mb': measured['peak_rss_mb'],
+                            'size_bytes': size,
+                            'bitrate_kbps': size * 8 / measured['out_time'] / 1000 if measured['out_time'] else None,
+                            'psnr': (4 * psnr['y'] + psnr['u'] + psnr['v']) / 6,
+                            'psnr_y': psnr['y'], 'psnr_u': psnr['u'], 'psnr_v': psnr['v'],
+                            'ssim_y': ssim['y'],
+                        })
+                        if not keep:
+                            os.remove(output)
+    return rows
+
+def pareto_front(rows, objectives=OBJECTIVES):
+    """
+    Mark the runs that no other run of the same resolution beats on every objective.
+
+    Args:
+        rows (list): Output of run_sweep. Every row gets a 'pareto' bool.
+        objectives (tuple): (column, 1 if higher is better or -1 if lower is).
+
+    Returns:
+        dict: resolution -> rows of its front, by increasing bitrate.
+    """
+    fronts = {}
+    for resolution in dict.fromkeys(row['resolution'] for row in rows):
+        group = [row for row in rows if row['resolution'] == resolution]
+        # higher is better on every column; runs missing a value never win
+        scores = np.array([[sign * row[column] if row[column] is not None else -np.inf
+                            for column, sign in objectives] for row in group], dtype=np.float64)
+        # dominated[i]: some run is at least as good on everything and better on something
+        at_least = np.all(scores[:, None, :] >= scores[None, :, :], axis=-1)
+        better = np.any(scores[:, None, :] > scores[None, :, :], axis=-1)
+        dominated = np.any(at_least & better, axis=0)
+        for row, is_dominated in zip(group, dominated):
+            row['pareto'] = not is_dominated
+        fronts[resolution] = sorted((row for row in group if row['pareto']),
+                                    key=lambda row: row['bitrate_kbps'] or 0)
+    return fronts
+
+def write_results(rows, fronts, output, metadata=None):
+    """
+    Write the runs as output.csv and, with the Pareto fronts, as output.json.
+    """
+    if rows:
+        with open(f'{output}.csv', 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    with open(f'{output}.json', 'w') as f:
+        json.dump({**(metadata or {}), 'runs': rows,
+                   'pareto': {resolution: [rows.index(row) for row in front] for resolution, front in fronts.items()}},
+                  f, indent=2)
+
+def _per_codec(values, cast=str):
+    # ['h265=fast,medium', 'vp9=2'] -> {'h265': ['fast', 'medium'], 'vp9': ['2']}
+    result = {}
+    for value in values or []:
+        codec, _, items = value.partition('=')
+        if codec not in RD_CODECS or not items:
+            raise argparse.ArgumentTypeError(f"Expected CODEC=VALUE[,VALUE...] with a codec of {sorted(RD_CODECS)}")
+        result[codec] = [cast(item) for item in items.split(',')]
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rate-distortion and speed sweep of the VideoConverter codecs")
+    parser.add_argument('--source', help="Clip to encode (default: a synthetic clip, nothing needs to be downloaded)")
+    parser.add_argument('--seconds', type=float, default=2, help="Length of the clip used")
+    parser.add_argument('--codecs', nargs='+', choices=list(RD_CODECS), help="Codecs (default: all)")
+    parser.add_argument('--resolutions', nargs='+', choices=list(RESOLUTIONS), help="Resolutions (default: all)")
+    parser.add_argument('--preset', action='append', metavar='CODEC=P[,P...]', help="Presets of a codec")
+    parser.add_argument('--crf', action='append', metavar='CODEC=N[,N...]', help="CRFs of a codec")
+    parser.add_argument('--threads', type=int, default=1, help="Threads per encode")
+    parser.add_argument('--psnr-every', type=int, default=1, help="Only score every Nth frame")
+    parser.add_argument('--workdir', help="Keep the references and encodes here")
+    parser.add_argument('--output', default='rd_results', help="Results go to OUTPUT.csv and OUTPUT.json")
+    args = parser.parse_args(argv)
+    try:
+        presets, crfs = _per_codec(args.preset), _per_codec(args.crf, int)
+    except (argparse.ArgumentTypeError, ValueError) as e:
+        parser.error(str(e))
+
+    with tempfile.TemporaryDirectory() as temporary:
+        source = args.source
+        if source is None:
+            source = os.path.join(temporary, 'synthetic.mkv')
+            synthetic_source(source, args.seconds)
+        rows = run_sweep(source, args.codecs, args.resolutions, presets, crfs, args.workdir, args.seconds,
+                         args.threads, args.psnr_every, keep=args.workdir is not None)
+
+    fronts = pareto_front(rows)
+    for row in rows:
+        bitrate = f"{row['bitrate_kbps']:>9.1f}" if row['bitrate_kbps'] is not None else f"{'?':>9}"
+        print(f"{row['resolution']:>5} {row['codec']:<5} {row['preset']:<9} crf {row['crf']:<3} "
+              f"{bitrate} kb/s {row['psnr']:6.2f} dB {row['encode_fps']:8.1f} fps "
+              f"{row['cpu_time']:7.2f} s CPU {row['peak_rss_mb']:7.1f} MB{' *' if row['pareto'] else ''}")
+
+    write_results(rows, fronts, args.output, {
+        'machine': platform.platform(), 'ffmpeg': ffmpeg_version(), 'source': args.source or 'synthetic',
+        'seconds': args.seconds, 'threads': args.threads, 'objectives': [column for column, _ in OBJECTIVES],
+    })
+    print(f"{len(rows)} runs, Pareto fronts marked with *. Results in {args.output}.csv and {args.output}.json")
+    return 0 if rows else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,45 +1,307 @@
 import subprocess
+import os
+import tempfile
+
+from P2_video.main import Rendition
+from P1_video.probe import probe
+from P1_video.jobs import run_command, run_commands, stage
+from P1_video.encode_cache import run_cached
 
 
 # create a 30s file to faster working
 # subprocess.run('ffmpeg -i BadBunny.mp4 -t 30 -c:v copy -c:a copy Bunny.mp4', shell=True)
 
+# Encoder of every codec of the ladder and its rough cost relative to VP8 at the
+# ladder settings, used to split the CPU budget so all of them finish together
+LADDER_CODECS = {
+    'vp8': ('libvpx', 1),
+    'h265': ('libx265', 2),
+    'vp9': ('libvpx-vp9', 3),
+    'av1': ('libaom-av1', 6),
+}
+
+def _power_of_two_below(value):
+    # largest power of two <= value (at least 1)
+    return 1 << max(int(value), 1).bit_length() - 1
+
+def split_threads(codecs, budget):
+    """
+    Share a thread budget between encoders in proportion to their cost, at least one each.
+
+    Args:
+        codecs (list): Keys of LADDER_CODECS.
+        budget (int): Threads to share, at least one per codec.
+
+    Returns:
+        dict: codec -> threads, never more than budget in total.
+    """
+    if len(codecs) > budget:
+        raise ValueError(f"{len(codecs)} encoders cannot share {budget} threads, each needs at least one")
+    weights = {codec: LADDER_CODECS[codec][1] for codec in codecs}
+    total = sum(weights.values())
+    # one thread each, the rest in proportion to the cost (rounded down)
+    spare = budget - len(codecs)
+    shares = {codec: spare * weight / total for codec, weight in weights.items()}
+    threads = {codec: 1 + int(share) for codec, share in shares.items()}
+    # hand out what rounding down left, biggest remainders first
+    for codec in sorted(shares, key=lambda c: shares[c] - int(shares[c]), reverse=True):
+        if sum(threads.values()) >= budget:
+            break
+        threads[codec] += 1
+    return threads
+
+def codec_threading_args(codec, threads, width):
+    """
+    Encoder options that let one encoder use `threads` threads efficiently.
+
+    libvpx only parallelizes across tiles (VP9) or token partitions (VP8, set
+    through -slices) and libaom across
+    tiles and rows, so those are sized to the threads (tiles are at least 256
+    pixels wide). libx265 gets a thread pool of that size.
+
+    Args:
+        codec (str): Key of LADDER_CODECS.
+        threads (int): Threads for this encoder.
+        width (int): Width of the video.
+
+    Returns:
+        list: ffmpeg output options.
+    """
+    tile_columns = _power_of_two_below(min(threads, max(width // 256, 1)))
+    if codec == 'vp8':
+        # ffmpeg turns -slices into libvpx token partitions (1 to 8)
+        partitions = min(_power_of_two_below(threads), 8)
+        return ['-deadline', 'good', '-cpu-used', '4', '-slices', str(partitions), '-threads', str(threads)]
+    if codec == 'vp9':
+        return ['-deadline', 'good', '-cpu-used', '4', '-row-mt', '1',
+                '-tile-columns', str(tile_columns.bit_length() - 1), '-threads', str(threads)]
+    if codec == 'h265':
+        return ['-preset', 'fast', '-x265-params', f'pools={threads}', '-threads', str(threads)]
+    if codec == 'av1':
+        tile_rows = _power_of_two_below(max(threads // tile_columns, 1))
+        return ['-cpu-used', '6', '-row-mt', '1', '-tiles', f'{tile_columns}x{tile_rows}', '-threads', str(threads)]
+    raise ValueError(f"Unknown codec '{codec}', use one of {sorted(LADDER_CODECS)}")
+
 class VideoConverter:
     def __init__(self, input_video):
         self.input_video = input_video
 
-    def convert_to_vp8(self, output_video):
-        self._convert_video('libvpx', 'vp8', output_video)
+    def convert_to_vp8(self, output_video, chunked=False):
+        return self._convert_video('libvpx', 'vp8', output_video, chunked)
+
+    def convert_to_vp9(self, output_video, chunked=False):
+        return self._convert_video('libvpx-vp9', 'vp9', output_video, chunked)
 
-    def convert_to_vp9(self, output_video):
-        self._convert_video('libvpx-vp9', 'vp9', output_video)
+    def convert_to_h265(self, output_video, chunked=False):
+        return self._convert_video('libx265', 'h265', output_video, chunked)
 
-    def convert_to_h265(self, output_video):
-        self._convert_video('libx265', 'h265', output_video)
+    def convert_to_av1(self, output_video, chunked=False):
+        return self._convert_video('libaom-av1', 'av1', output_video, chunked)
 
-    def convert_to_av1(self, output_video):
-        self._convert_video('libaom-av1', 'av1', output_video)
+    def _convert_video(self, codec, extension, output_video, chunked=False):
+        # True if output_video was written
+        if chunked:
+            return self.convert_chunked(codec, output_video)
 
-    def _convert_video(self, codec, extension, output_video):
         command = [
             'ffmpeg',
             '-i', self.input_video,
             '-c:v', codec,
             output_video
         ]
-        subprocess.run(command)
+        try:
+            run_cached(command, [output_video], check=True)
+            return True
+        except subprocess.CalledProcessError as e:
+            print(f"Error during {extension} conversion: {e}")
+            return False
+
+    def convert_ladder(self, outputs, threads=None, single_decode=True):
+        """
+        Encode several codecs at the same time within one CPU budget.
+
+        The budget is split with split_threads and every encoder gets the matching
+        threading options (codec_threading_args). With single_decode the source is
+        decoded once and split to all the encoders in one ffmpeg; since they share
+        the decode they run at the pace of the slowest one, which is why the
+        heavy codecs get more threads. Without it, every codec is its own job,
+        heaviest first, and the job runner starts them as threads become free.
+
+        With fewer threads than codecs, single_decode cannot stay within the budget
+        (all the encoders run at once) and raises ValueError. One job per codec then
+        runs them in turns, one thread each.
 
+        Args:
+            outputs (dict): codec ('vp8', 'vp9', 'h265', 'av1') -> output path.
+            threads (int, optional): Thread budget. Defaults to the number of cores.
+            single_decode (bool): One ffmpeg for all the outputs, or one per codec.
+
+        Returns:
+            bool: True if every output was written.
+        """
+        budget = threads or os.cpu_count() or 1
+        if len(outputs) > budget and single_decode:
+            raise ValueError(f"{len(outputs)} encoders in one ffmpeg need at least {len(outputs)} threads, "
+                             f"the budget is {budget}: use single_decode=False")
+        # more codecs than threads: one thread each, the job runner runs them in turns
+        shares = split_threads(list(outputs), budget) if len(outputs) <= budget else dict.fromkeys(outputs, 1)
+        video = probe(self.input_video).video
+        if video is None:
+            raise ValueError(f"{self.input_video} has no video stream")
+        width = video.width
+        encoders = [(codec, ['-map', '0:a?', '-c:v', LADDER_CODECS[codec][0],
+                             *codec_threading_args(codec, shares[codec], width), path])
+                    for codec, path in outputs.items()]
+
+        try:
+            with stage(f"ladder: {', '.join(outputs)}"):
+                if single_decode:
+                    labels = [f'[v{i}]' for i in range(len(encoders))]
+                    command = ['ffmpeg', '-v', 'error', '-y', '-i', self.input_video,
+                               '-filter_complex', f"[0:v]split={len(encoders)}{''.join(labels)}"]
+                    for label, (_, options) in zip(labels, encoders):
+                        command += ['-map', label, *options]
+                    run_cached(command, list(outputs.values()), check=True)
+                else:
+                    encoders.sort(key=lambda encoder: LADDER_CODECS[encoder[0]][1], reverse=True)
+                    commands = [['ffmpeg', '-v', 'error', '-y', '-nostdin', '-i', self.input_video,
+                                 '-map', '0:v:0', *options] for _, options in encoders]
+                    # on the process-wide runner, within its budget too
+                    results = run_commands(commands, max_threads=budget,
+                                           threads=[shares[codec] for codec, _ in encoders], check=True)
+                    for result in results:
+                        if isinstance(result, Exception):
+                            raise result
+            return True
+
+        except subprocess.CalledProcessError as e:
+            print(f"Error during ladder encoding: {e}")
+            return False
+
+    def convert_chunked(self, codec, output_video, codec_args=(), workers=None, threads_per_job=None, segment_time=None):
+        """
+        Encode the video in pieces at the same time and join them without re-encoding.
+
+        The source is cut at keyframes with a stream copy (so every piece starts a
+        GOP), the pieces are encoded with exactly the same settings in a bounded
+        pool, and the concat demuxer joins the encoded pieces. The audio is encoded
+        once from the source while joining.
+
+        Args:
+            codec (str): ffmpeg video encoder, e.g. 'libaom-av1'.
+            output_video (str): Path to the output video file.
+            codec_args (list): Extra encoder options, the same for every piece.
+            workers (int, optional): Pieces encoded at the same time. Defaults to the
+                number of cores divided by threads_per_job.
+            threads_per_job (int, optional): -threads of every encode. Defaults to 1 so
+                the pool alone spreads the work over the cores.
+            segment_time (float, optional): Target piece length in seconds. By default
+                the video is cut in about 4 pieces per worker.
+
+        Returns:
+            bool: True if the output was written.
+        """
+        threads_per_job = threads_per_job or 1
+        workers = workers or max(1, (os.cpu_count() or 1) // threads_per_job)
+        if segment_time is None:
+            duration = probe(self.input_video).duration or 0
+            segment_time = max(duration / (4 * workers), 2) if duration else 10
+
+        with tempfile.TemporaryDirectory(prefix='chunks_') as workdir:
+            try:
+                # 1. cut at the first keyframe after every segment_time, no re-encode
+                with stage('chunked: cut'):
+                    run_command(['ffmpeg', '-v', 'error', '-i', self.input_video, '-map', '0:v:0', '-c', 'copy',
+                                 '-f', 'segment', '-segment_time', str(segment_time), '-reset_timestamps', '1',
+                                 os.path.join(workdir, 'source_%05d.mkv')], check=True)
+                sources = sorted(f for f in os.listdir(workdir) if f.startswith('source_'))
+
+                # 2. encode the pieces, identical settings for all of them, as many at a time
+                #    as workers * threads_per_job threads allow
+                encoded = [os.path.join(workdir, source.replace('source_', 'encoded_')) for source in sources]
+                commands = [['ffmpeg', '-v', 'error', '-nostdin', '-i', os.path.join(workdir, source),
+                             '-c:v', codec, *codec_args, '-threads', str(threads_per_job), target]
+                            for source, target in zip(sources, encoded)]
+                with stage(f'chunked: encode {codec}'):
+                    results = run_commands(commands, max_threads=workers * threads_per_job,
+                                           threads=threads_per_job, check=True)
+                for result in results:
+                    if isinstance(result, Exception):
+                        raise result
+
+                # 3. join in order, adding the audio of the source
+                list_file = os.path.join(workdir, 'pieces.txt')
+                with open(list_file, 'w') as f:
+                    f.writelines(f"file '{path}'\n" for path in encoded)
+                with stage('chunked: join'):
+                    run_command(['ffmpeg', '-v', 'error', '-y', '-f', 'concat', '-safe', '0', '-i', list_file,
+                                 '-i', self.input_video, '-map', '0:v', '-map', '1:a?', '-c:v', 'copy',
+                                 output_video], check=True)
+                return True
+
+            except subprocess.CalledProcessError as e:
+                print(f"Error during chunked encoding: {e}")
+                return False
 
 class VideoComparison:
-    def __init__(self, input_vp8, input_vp9, output_video):
+    def __init__(self, input_vp8, input_vp9, output_video=None, reference=None):
+        """
+        Args:
+            input_vp8 (str): VP8 encode.
+            input_vp9 (str): VP9 encode.
+            output_video (str, optional): Side by side video of both.
+            reference (str, optional): Source of both encodes, needed for the metrics.
+        """
         self.input_vp8 = input_vp8
         self.input_vp9 = input_vp9
         self.output_video = output_video
+        self.reference = reference
 
-    def compare_vp8_vp9(self):
-        # Combine VP8 and VP9 videos side by side
-        subprocess.run(['ffmpeg', '-i', self.input_vp8, '-i', self.input_vp9, '-filter_complex', 'hstack=inputs=2', self.output_video])
+    def compare_vp8_vp9(self, render=True, metrics=False, every=1, data_file=None):
+        """
+        Compare the two encodes by eye and/or with objective metrics.
 
+        Args:
+            render (bool): Build the side by side video (a full extra encode).
+            metrics (bool): Score both against the reference with PSNR and SSIM
+                per plane, decoding the three videos together.
+            every (int): Only score every Nth frame.
+            data_file (str, optional): .npz file for the per frame scores.
+
+        Returns:
+            dict: Output of quality.compare_videos with 'vp8' and 'vp9', or None without metrics.
+        """
+        if render and self.output_video is None:
+            raise ValueError("Rendering needs an output_video")
+        results = None
+        if metrics:
+            if self.reference is None:
+                raise ValueError("The metrics need the reference video the encodes were made from")
+            # NumPy is only loaded when scoring
+            from .quality import compare_videos, save_metrics
+
+            with stage('compare: metrics'):
+                results = compare_videos(self.reference, {'vp8': self.input_vp8, 'vp9': self.input_vp9}, every)
+            for name, result in results.items():
+                psnr, ssim = result['mean_psnr'], result['mean_ssim']
+                print(f"{name}: PSNR Y {psnr['y']:.2f} U {psnr['u']:.2f} V {psnr['v']:.2f} dB, "
+                      f"SSIM Y {ssim['y']:.4f} U {ssim['u']:.4f} V {ssim['v']:.4f}")
+            if data_file:
+                save_metrics(results, data_file)
+
+        if render:
+            # Combine VP8 and VP9 videos side by side
+            run_command(['ffmpeg', '-i', self.input_vp8, '-i', self.input_vp9, '-filter_complex', 'hstack=inputs=2', self.output_video])
+        return results
+
+
+# The resolutions used in the exercises
+BUNNY_LADDER = [
+    Rendition('Bunny_720p.mp4', 1280, 720),
+    Rendition('Bunny_480p.mp4', 640, 480),
+    Rendition('Bunny_240p.mp4', 320, 240),
+    Rendition('Bunny_120p.mp4', 160, 120),
+]
 
 def change_resolution(input_video, output_video, width, height):
     """
@@ -52,15 +314,17 @@ def change_resolution(input_video, output_video, width, height):
         height (int): New height of the video.
 
     Returns:
-        None
+        bool: True if the video was written.
     """
-    resize_command = f'ffmpeg -i "{input_video}" -vf "scale={width}:{height}" -c:a copy "{output_video}"'
+    resize_command = ['ffmpeg', '-i', input_video, '-vf', f'scale={width}:{height}', '-c:a', 'copy', output_video]
 
     try:
-        subprocess.run(resize_command, shell=True, check=True)
+        run_cached(resize_command, [output_video], check=True)
         print(f"Video resolution changed to {width}x{height}.")
+        return True
     except subprocess.CalledProcessError as e:
         print(f"Error: {e}")
+        return False
 
 
 ''' Convert bunny 30s video to all the resolutions needed
@@ -71,6 +335,11 @@ new_height = 120
 change_resolution(input_video, output_video, new_width, new_height)
 '''
 
+''' Same, all the resolutions from a single decode of Bunny.mp4
+from P2_video.main import change_resolution_ladder
+change_resolution_ladder("Bunny.mp4", BUNNY_LADDER)
+'''
+
 ''' Ex1
 input_video_path = 'Bunny_480p.mp4'
 converter = VideoConverter(input_video_path)
@@ -86,6 +355,14 @@ converter.convert_to_h265('output_h265.mp4')
 
 # Convert to AV1
 converter.convert_to_av1('output_av1.webm')
+
+# The slow encoders, with the input split in keyframe-aligned pieces encoded in parallel
+converter.convert_to_h265('output_h265.mp4', chunked=True)
+converter.convert_to_av1('output_av1.webm', chunked=True)
+
+# All four at once from a single decode, sharing the cores
+converter.convert_ladder({'vp8': 'output_vp8.webm', 'vp9': 'output_vp9.webm',
+                          'h265': 'output_h265.mp4', 'av1': 'output_av1.webm'})
 '''
 
 ''' Ex2
@@ -96,6 +373,10 @@ output_video_path = 'comparison_output.mp4'
 video_comparison = VideoComparison(input_vp8_path, input_vp9_path, output_video_path)
 video_comparison.compare_vp8_vp9()
 
+# Numbers instead of impressions: PSNR and SSIM of both against Bunny_480p.mp4, without the side by side encode
+video_comparison = VideoComparison(input_vp8_path, input_vp9_path, reference='Bunny_480p.mp4')
+video_comparison.compare_vp8_vp9(render=False, metrics=True, data_file='comparison_metrics.npz')
+
 # Viendo los videos uno al lado del otr, creo que no veo ninguna diferencia.
 # Lo cierto es que la resolucion es demasiado baja como para notar nada.
 # Pero si que me da la sensacion de que el vp9 sea mejor, ya que no se
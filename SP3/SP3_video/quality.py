@@ -0,0 +1,134 @@
+import numpy as np
+
+from P1_video.rawvideo import read_frames, probe_size
+from P2_video.chroma import psnr
+
+PLANES = ('y', 'u', 'v')
+
+def _block_sums(plane, block):
+    # sums of the block x block tiles of a plane, rows and columns that do not fill a tile are left out
+    rows, columns = plane.shape[-2] // block, plane.shape[-1] // block
+    tiles = plane[..., :rows * block, :columns * block]
+    return tiles.reshape(plane.shape[:-2] + (rows, block, columns, block)).sum(axis=(-3, -1))
+
+def _window_sums(tiles):
+    # every 2x2 group of neighbouring tiles: windows twice the tile side, one tile apart
+    return tiles[..., :-1, :-1] + tiles[..., 1:, :-1] + tiles[..., :-1, 1:] + tiles[..., 1:, 1:]
+
+def ssim(reference, test, window=8, peak=255):
+    """
+    SSIM of test against reference over the last two axes, so a stack of planes
+    gives one value per frame.
+
+    Local statistics use the windows of ffmpeg's ssim filter: uniform window x
+    window blocks on a grid with a stride of half the window (8x8 blocks every 4
+    pixels by default), the variances normalized by n - 1. The pixels past the
+    last full half window at the right and bottom edges are left out, as ffmpeg
+    does.
+
+    Args:
+        reference (np.array): (..., h, w) reference plane(s).
+        test (np.array): Planes of the same shape to score.
+        window (int): Side of the block, reduced for planes smaller than it.
+        peak (int): Largest sample value.
+
+    Returns:
+        np.array: Mean SSIM, 1.0 for identical planes.
+    """
+    block = max(min(window, *reference.shape[-2:]) // 2, 1)
+    x = reference.astype(np.float64)
+    y = test.astype(np.float64)
+    count = (2 * block) ** 2
+
+    sum_x = _window_sums(_block_sums(x, block))
+    sum_y = _window_sums(_block_sums(y, block))
+    squares = _window_sums(_block_sums(x * x + y * y, block))
+    products = _window_sums(_block_sums(x * y, block))
+
+    # ffmpeg's formula, on the sums instead of the means
+    c1 = (0.01 * peak) ** 2 * count
+    c2 = (0.03 * peak) ** 2 * count * (count - 1)
+    variances = squares * count - sum_x * sum_x - sum_y * sum_y
+    covariance = products * count - sum_x * sum_y
+    local = ((2 * sum_x * sum_y + c1) * (2 * covariance + c2)
+             / ((sum_x * sum_x + sum_y * sum_y + c1) * (variances + c2)))
+    return np.mean(local, axis=(-2, -1))
+
+def compare_videos(reference, tests, every=1, width=None, height=None, window=8):
+    """
+    PSNR and SSIM of every plane of one or more encodes against their source.
+
+    The reference and every test video are decoded at the same time as yuv420p
+    frames and scored one frame at a time, so memory does not grow with the
+    length of the videos (only the per frame scores are kept). Encodes at another
+    resolution are scaled to the reference's by ffmpeg.
+
+    Args:
+        reference (str): Path to the source video.
+        tests (dict): Name -> path of every encode to score, e.g. {'vp8': 'output_vp8.webm'}.
+        every (int): Only score every Nth frame (1 = all of them). The frames in
+            between are dropped by ffmpeg's select filter, never piped.
+        width (int, optional): Width the frames are compared at. Defaults to the reference's.
+        height (int, optional): Height the frames are compared at. Defaults to the reference's.
+        window (int): SSIM block size.
+
+    Returns:
+        dict: For every name, 'psnr' and 'ssim' arrays of shape (frames, 3) with
+        the Y, U and V scores, 'frames' with the source index of every scored
+        frame and the means of every plane in 'mean_psnr' and 'mean_ssim'.
+    """
+    if width is None or height is None:
+        source_width, source_height = probe_size(reference)
+        width, height = width or source_width, height or source_height
+    filters = f'select=not(mod(n\\,{every}))' if every > 1 else None
+
+    def decode(path):
+        # passthrough: keep only the selected frames instead of filling the gaps to a constant frame rate
+        return read_frames(path, width, height, pix_fmt='yuv420p', filters=filters,
+                           output_args=['-fps_mode', 'passthrough'])
+
+    names = list(tests)
+    streams = [decode(reference)] + [decode(tests[name]) for name in names]
+    scores = {name: {'psnr': [], 'ssim': []} for name in names}
+    frames = 0
+    try:
+        # lockstep: one frame of every video at a time, stops at the shortest one
+        for decoded in zip(*streams):
+            source = decoded[0]
+            for name, planes in zip(names, decoded[1:]):
+                scores[name]['psnr'].append([psnr(a, b) for a, b in zip(source, planes)])
+                scores[name]['ssim'].append([ssim(a, b, window) for a, b in zip(source, planes)])
+            frames += 1
+    finally:
+        # also stops the decoders of the longer videos
+        for stream in streams:
+            stream.close()
+
+    results = {}
+    for name in names:
+        result = {metric: np.array(values, dtype=np.float64).reshape(-1, len(PLANES))
+                  for metric, values in scores[name].items()}
+        result['frames'] = np.arange(frames, dtype=np.uint32) * every
+        for metric in ('psnr', 'ssim'):
+            means = result[metric].mean(axis=0) if frames else np.full(len(PLANES), np.nan)
+            result[f'mean_{metric}'] = dict(zip(PLANES, means.tolist()))
+        results[name] = result
+    return results
+
+def save_metrics(results, data_file):
+    """
+    Store the per frame arrays of compare_videos as compressed NumPy arrays (.npz),
+    named like 'vp8_psnr' and 'vp8_ssim'.
+    """
+    arrays = {f'{name}_{key}': value for name, result in results.items()
+              for key, value in result.items() if isinstance(value, np.ndarray)}
+    np.savez_compressed(data_file, planes=np.array(PLANES), **arrays)
+
+
+'''
+# Score the VP8 and VP9 encodes of exercise 1 against their source, every 5th frame
+results = compare_videos('Bunny_480p.mp4', {'vp8': 'output_vp8.webm', 'vp9': 'output_vp9.webm'}, every=5)
+for name, result in results.items():
+    print(name, result['mean_psnr'], result['mean_ssim'])
+save_metrics(results, 'comparison_metrics.npz')
+'''
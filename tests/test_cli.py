@@ -0,0 +1,9 @@
+import pytest
+
+from P1_video.cli import main
+
+
+@pytest.mark.parametrize('command', ['histogram', 'motion'])
+def test_nothing_to_do_fails(command, capsys):
+    assert main([command, 'input.mp4']) == 1
+    assert 'nothing to do' in capsys.readouterr().err
@@ -0,0 +1,39 @@
+import struct
+
+import numpy as np
+
+from P1_video.codec import FLAG_HUFFMAN, HEADER_FORMAT, IntraFrameCodec
+
+rng = np.random.default_rng(0)
+
+
+def smooth_frame(height=64, width=64):
+    y, x = np.mgrid[0:height, 0:width]
+    return np.stack([x * 2, y * 2, x + y], axis=-1).astype(np.uint8)
+
+
+def noisy_frames(n=2, height=40, width=56):
+    return rng.integers(0, 256, (n, height, width, 3), dtype=np.uint8)
+
+
+def flags(bitstream):
+    return struct.unpack_from(HEADER_FORMAT, bitstream)[4]
+
+
+def test_huffman_is_skipped_when_it_does_not_pay():
+    frame = smooth_frame()
+    plain = IntraFrameCodec(75).encode(frame)
+    coded = IntraFrameCodec(75, huffman=True).encode(frame)
+    assert len(coded) <= len(plain)
+    assert not flags(coded) & FLAG_HUFFMAN
+
+
+def test_huffman_table_is_fitted_to_every_stream():
+    codec = IntraFrameCodec(75, huffman=True)
+    # a first stream with other statistics must not shape the table of the next one
+    codec.encode(smooth_frame())
+    frames = noisy_frames()
+    coded = codec.encode(frames)
+    assert flags(coded) & FLAG_HUFFMAN
+    assert len(coded) < len(IntraFrameCodec(75).encode(frames))
+    assert coded == IntraFrameCodec(75, huffman=True).encode(frames)
@@ -0,0 +1,42 @@
+import shutil
+import subprocess
+
+import pytest
+
+from S2_video.main import VideoEditor
+
+av = pytest.importorskip('av')
+pytestmark = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="needs ffmpeg")
+
+
+def streams(path):
+    with av.open(str(path)) as container:
+        return [(stream.type, stream.codec_context.name,
+                 stream.codec_context.channels if stream.type == 'audio' else None)
+                for stream in container.streams]
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    # edit_video writes its intermediate files in the working directory
+    monkeypatch.chdir(tmp_path)
+    subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc2=size=160x120:duration=2',
+                    '-f', 'lavfi', '-i', 'sine=duration=2', '-ac', '2', '-c:v', 'libx264', '-c:a', 'aac',
+                    '-shortest', 'source.mp4'], check=True)
+    return tmp_path / 'source.mp4'
+
+
+def test_graph_writes_the_same_streams_as_edit_video(source, tmp_path):
+    VideoEditor(str(source), 'steps.mp4').edit_video()
+    assert VideoEditor(str(source), 'graph.mp4').edit_video_graph()
+    assert streams(tmp_path / 'graph.mp4') == streams(tmp_path / 'steps.mp4')
+
+
+def test_graph_audio_outputs(source, tmp_path):
+    outputs = ('mono.mp3', 'stereo.mp3', 'audio.aac')
+    VideoEditor(str(source), 'steps.mp4').edit_video()
+    assert VideoEditor(str(source), 'graph.mp4').edit_video_graph(audio_outputs=outputs)
+    assert streams(tmp_path / 'graph.mp4') == streams(tmp_path / 'steps.mp4')
+    assert streams(tmp_path / 'mono.mp3') == [('audio', 'mp3float', 1)]
+    assert streams(tmp_path / 'stereo.mp3') == [('audio', 'mp3float', 2)]
+    assert streams(tmp_path / 'audio.aac') == [('audio', 'aac', 2)]
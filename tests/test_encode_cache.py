@@ -0,0 +1,44 @@
+import shutil
+import subprocess
+
+import pytest
+
+from P1_video.encode_cache import EncodeCache, run_cached
+
+pytestmark = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="needs ffmpeg")
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'source.wav'
+    subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'sine=duration=1', str(path)], check=True)
+    return str(path)
+
+
+def convert(source, output, overwrite):
+    return ['ffmpeg', '-v', 'error', '-y' if overwrite else '-n', '-i', source, '-c:a', 'pcm_s16le', output]
+
+
+def test_hit_copies_the_stored_output(source, tmp_path):
+    cache = EncodeCache(str(tmp_path / 'cache'))
+    first, second = str(tmp_path / 'first.wav'), str(tmp_path / 'second.wav')
+    run_cached(convert(source, first, True), [first], cache, check=True)
+    assert cache.get(cache.key(convert(source, second, True), [second]), [second])
+    assert open(second, 'rb').read() == open(first, 'rb').read()
+
+
+def test_no_overwrite_keeps_existing_outputs(source, tmp_path):
+    cache = EncodeCache(str(tmp_path / 'cache'))
+    first, second = str(tmp_path / 'first.wav'), str(tmp_path / 'second.wav')
+    run_cached(convert(source, first, True), [first], cache, check=True)
+    with open(second, 'wb') as f:
+        f.write(b'keep me')
+    run_cached(convert(source, second, False), [second], cache, capture_output=True)
+    assert open(second, 'rb').read() == b'keep me'
+
+
+def test_tee_commands_are_not_cached(source, tmp_path):
+    cache = EncodeCache(str(tmp_path / 'cache'))
+    output = str(tmp_path / 'out.wav')
+    command = ['ffmpeg', '-y', '-i', source, '-map', '0:a', '-f', 'tee', f'{output}|[f=null]-']
+    assert cache.key(command, [output]) is None
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from P1_video import huffman
+from P1_video.huffman import MAX_CODE_LENGTH, HuffmanTable, huffman_decode, huffman_encode
+
+rng = np.random.default_rng(0)
+INPUTS = {
+    'random': rng.integers(0, 256, 100_000),
+    'skewed': rng.geometric(0.3, 200_000).clip(0, 255),
+    'single symbol': np.full(1000, 7),
+    'empty': np.zeros(0, dtype=np.int64),
+}
+
+
+def round_trip(symbols, minlength=256):
+    table = HuffmanTable.from_frequencies(np.bincount(symbols, minlength=minlength))
+    encoded = huffman_encode(symbols, table)
+    np.testing.assert_array_equal(huffman_decode(encoded, symbols.size, table), symbols)
+    return table, encoded
+
+
+@pytest.mark.parametrize('name', INPUTS)
+def test_round_trip(name):
+    round_trip(INPUTS[name])
+
+
+@pytest.mark.parametrize('name', INPUTS)
+def test_round_trip_across_small_chunks(name, monkeypatch):
+    # codes straddling every kind of chunk boundary
+    monkeypatch.setattr(huffman, 'ENCODE_CHUNK', 7)
+    monkeypatch.setattr(huffman, 'DECODE_CHUNK', 64)
+    round_trip(INPUTS[name][:5000])
+
+
+def test_skewed_input_compresses():
+    _, encoded = round_trip(INPUTS['skewed'])
+    assert len(encoded) < INPUTS['skewed'].size / 2
+
+
+def test_length_limited_table():
+    # Fibonacci frequencies make an unlimited code 29 bits deep
+    frequencies = [1, 1]
+    while len(frequencies) < 30:
+        frequencies.append(frequencies[-1] + frequencies[-2])
+    symbols = np.repeat(np.arange(30), frequencies)
+    rng.shuffle(symbols)
+    assert huffman._code_lengths(np.array(frequencies)).max() > MAX_CODE_LENGTH
+    table, _ = round_trip(symbols, minlength=30)
+    assert table.max_length <= MAX_CODE_LENGTH
+
+
+def test_missing_data():
+    symbols = INPUTS['skewed'][:1000]
+    table, encoded = round_trip(symbols)
+    with pytest.raises(ValueError):
+        huffman_decode(encoded[:100], symbols.size, table)
+
+
+def test_symbol_without_code():
+    table = HuffmanTable.from_frequencies([5, 0, 3])
+    with pytest.raises(ValueError):
+        huffman_encode([0, 1, 2], table)
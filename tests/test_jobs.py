@@ -0,0 +1,96 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+from P1_video.jobs import JobRunner, Telemetry, command_threads, run_commands
+
+PYTHON = [sys.executable, '-c']
+
+
+def test_run_commands_inside_a_running_loop():
+    async def caller():
+        return run_commands([PYTHON + ['print(1)'], PYTHON + ['print(2)']], threads=[1, 2],
+                            capture_output=True, text=True)
+
+    results = asyncio.run(caller())
+    assert [result.stdout.strip() for result in results] == ['1', '2']
+
+
+def test_threads_per_command_are_admitted_separately():
+    events = []
+    runner = JobRunner(3)
+    commands = [PYTHON + ['import time; time.sleep(0.2)']] * 3
+
+    async def main():
+        original = runner._acquire
+
+        async def acquire(threads):
+            events.append(threads)
+            await original(threads)
+
+        runner._acquire = acquire
+        return await runner.gather(commands, threads=[3, 1, 2])
+
+    assert all(result.returncode == 0 for result in asyncio.run(main()))
+    assert events == [3, 1, 2]
+
+
+def test_thread_counts_must_match_the_commands():
+    with pytest.raises(ValueError):
+        asyncio.run(JobRunner(2).gather([PYTHON + ['pass']], threads=[1, 1]))
+
+
+@pytest.mark.parametrize('command, threads', [
+    (['ffmpeg', '-i', 'in.mp4', 'out.mp4'], None),
+    (['ffmpeg', '-i', 'in.mp4', '-threads', '0', 'out.mp4'], None),
+    (['ffmpeg', '-i', 'in.mp4', '-threads', '2', 'a.mp4', '-threads', '3', 'b.mp4'], 5),
+    (['ffprobe', 'in.mp4'], 1),
+])
+def test_command_threads(command, threads):
+    assert command_threads(command) == threads
+
+
+def test_unconstrained_ffmpeg_takes_the_whole_budget():
+    admitted = []
+    runner = JobRunner(4)
+
+    async def main():
+        original = runner._acquire
+
+        async def acquire(threads):
+            admitted.append(threads)
+            await original(threads)
+
+        runner._acquire = acquire
+        # a fake ffmpeg: the name is all that counts
+        await runner.run([sys.executable, '-c', 'pass'])
+        with pytest.raises(FileNotFoundError):
+            await runner.run(['ffmpeg-missing', '-i', 'in.mp4', 'out.mp4'])
+
+    asyncio.run(main())
+    assert admitted == [1, 4]
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason="counts descriptors in /proc")
+def test_cancelled_jobs_leak_no_descriptors(tmp_path):
+    # a long-running stand-in named ffmpeg, so every job gets a progress pipe
+    ffmpeg = tmp_path / 'ffmpeg'
+    ffmpeg.write_text(f'#!{sys.executable}\nimport time\ntime.sleep(30)\n')
+    ffmpeg.chmod(0o755)
+    runner = JobRunner(2)
+    telemetry = Telemetry(callback=lambda event: None)
+
+    async def main():
+        tasks = [asyncio.ensure_future(runner.run([str(ffmpeg), '-threads', '1', f'out{i}.mp4'],
+                                                  telemetry=telemetry)) for i in range(50)]
+        # two running, the others waiting for the budget
+        await asyncio.sleep(0.5)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    before = len(os.listdir('/proc/self/fd'))
+    asyncio.run(main())
+    assert len(os.listdir('/proc/self/fd')) == before
@@ -0,0 +1,38 @@
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+from SP3.SP3_video import main
+from SP3.SP3_video.main import LADDER_CODECS, VideoConverter, split_threads
+
+
+@pytest.mark.parametrize('budget', [1, 2, 3, 4, 6, 8, 13, 64])
+def test_split_threads_stays_within_budget(budget):
+    for count in range(1, min(budget, len(LADDER_CODECS)) + 1):
+        for codecs in itertools.combinations(LADDER_CODECS, count):
+            threads = split_threads(list(codecs), budget)
+            assert set(threads) == set(codecs)
+            assert all(share >= 1 for share in threads.values())
+            assert sum(threads.values()) <= budget
+
+
+def test_split_threads_gives_heavy_codecs_more():
+    threads = split_threads(list(LADDER_CODECS), 12)
+    assert threads['av1'] > threads['vp8']
+
+
+def test_split_threads_rejects_more_codecs_than_threads():
+    with pytest.raises(ValueError):
+        split_threads(list(LADDER_CODECS), 2)
+
+
+def test_single_decode_ladder_rejects_a_budget_below_the_codecs():
+    with pytest.raises(ValueError, match='single_decode=False'):
+        VideoConverter('input.mp4').convert_ladder({'vp8': 'a.webm', 'vp9': 'b.webm', 'av1': 'c.webm'}, threads=2)
+
+
+def test_ladder_without_video_stream(monkeypatch):
+    monkeypatch.setattr(main, 'probe', lambda path: SimpleNamespace(video=None))
+    with pytest.raises(ValueError, match='no video stream'):
+        VideoConverter('audio.mp3').convert_ladder({'vp8': 'a.webm'}, threads=1)
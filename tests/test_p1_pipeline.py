@@ -0,0 +1,134 @@
+import struct
+
+import numpy as np
+import pytest
+
+from P1_video.codec import (FLAG_HUFFMAN, HEADER_FORMAT, HEADER_SIZE, HUFFMAN_SYMBOLS, IntraFrameCodec,
+                             frame_costs)
+from P1_video.main import (RLE_MAX_RUN, DCTConverter, _run_length_encode_small, rgb_to_yuv, rgb_to_yuv_frame,
+                           run_length_decode, run_length_encode, yuv_to_rgb, yuv_to_rgb_frame)
+
+rng = np.random.default_rng(0)
+
+
+def test_rgb_to_yuv_frame_matches_scalar():
+    pixels = rng.integers(0, 256, (500, 3), dtype=np.uint8)
+    expected = np.array([rgb_to_yuv(tuple(int(c) for c in pixel)) for pixel in pixels])
+    np.testing.assert_allclose(rgb_to_yuv_frame(pixels), expected, atol=1e-3)
+    # rounded to the nearest integer, the 14-bit coefficients can be one off
+    fixed = rgb_to_yuv_frame(pixels, fixed_point=True)
+    assert fixed.dtype == np.int16
+    assert np.abs(fixed - np.rint(expected)).max() <= 1
+
+
+def test_yuv_to_rgb_frame_matches_scalar():
+    yuv = rgb_to_yuv_frame(rng.integers(0, 256, (500, 3), dtype=np.uint8))
+    expected = np.array([yuv_to_rgb(tuple(float(c) for c in pixel)) for pixel in yuv])
+    # float32 against float64 can land on the other side of a truncation
+    assert np.abs(yuv_to_rgb_frame(yuv).astype(int) - np.clip(expected, 0, 255)).max() <= 1
+
+
+def test_batched_dct_matches_block_loop():
+    frame = rng.random((32, 48))
+    loop = DCTConverter()
+    batched = DCTConverter(batched=True)
+    np.testing.assert_allclose(batched.encode(frame), loop.encode(frame), atol=1e-10)
+    np.testing.assert_allclose(batched.decode(batched.encode(frame)), frame, atol=1e-10)
+
+
+def test_batched_dct_pads_the_edges():
+    frame = rng.random((30, 45))
+    batched = DCTConverter(batched=True)
+    encoded = batched.encode(frame)
+    assert encoded.shape == (32, 48)
+    # same as the block loop on the frame padded by repeating its edges
+    np.testing.assert_allclose(encoded, DCTConverter().encode(np.pad(frame, ((0, 2), (0, 3)), mode='edge')),
+                               atol=1e-10)
+    np.testing.assert_allclose(batched.decode(encoded)[:30, :45], frame, atol=1e-10)
+
+
+def test_batched_dct_of_a_stack():
+    stack = rng.random((3, 16, 24))
+    batched = DCTConverter(batched=True)
+    encoded = batched.encode(stack)
+    for frame, frame_encoded in zip(stack, encoded):
+        np.testing.assert_allclose(frame_encoded, DCTConverter().encode(frame), atol=1e-10)
+
+
+def split_runs(data):
+    # the original byte loop, with runs longer than RLE_MAX_RUN split into several pairs
+    encoded, i = bytearray(), 0
+    while i < len(data):
+        count = 1
+        while i + count < len(data) and data[i + count] == data[i] and count < RLE_MAX_RUN:
+            count += 1
+        encoded += bytes((count, data[i]))
+        i += count
+    return bytes(encoded)
+
+
+@pytest.mark.parametrize('size', [0, 1, 63, 64, 1000])
+def test_rle_matches_the_byte_loop(size):
+    # short runs, so the original encoder can take them too
+    data = bytes(np.repeat(rng.integers(0, 4, size), rng.integers(1, 5, size))[:size].astype(np.uint8))
+    assert run_length_encode(data) == _run_length_encode_small(data)
+    assert run_length_decode(run_length_encode(data)) == data
+
+
+@pytest.mark.parametrize('run', [255, 256, 510, 511, 1000])
+def test_rle_splits_long_runs(run):
+    data = b'\x01\x02' + b'\x07' * run + b'\x03'
+    assert run_length_encode(data) == split_runs(data)
+    assert run_length_encode(np.frombuffer(data, dtype=np.uint8).reshape(1, -1)) == split_runs(data)
+    assert run_length_decode(run_length_encode(data)) == data
+
+
+def make_frames(n=2, height=45, width=70):
+    # smooth content with some texture, a size that is not a multiple of the blocks
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 3, y * 5, (x + y) * 2], axis=-1)
+    return np.clip(base + rng.normal(0, 8, (n, height, width, 3)), 0, 255).astype(np.uint8)
+
+
+FRAMES = make_frames()
+
+
+def psnr(a, b):
+    return 10 * np.log10(255 ** 2 / np.mean((a.astype(float) - b) ** 2))
+
+
+@pytest.mark.parametrize('huffman', [False, True])
+def test_codec_round_trip_error_by_quality(huffman):
+    scores = []
+    for quality in (10, 50, 90):
+        codec = IntraFrameCodec(quality, huffman=huffman)
+        decoded = codec.decode(codec.encode(FRAMES))
+        assert decoded.shape == FRAMES.shape
+        scores.append(psnr(FRAMES, decoded))
+    assert scores == sorted(scores)
+    assert scores[0] > 20
+    assert scores[-1] > 28
+
+
+def test_huffman_is_lossless_on_top_of_rle():
+    plain = IntraFrameCodec(75).encode(FRAMES)
+    coded = IntraFrameCodec(75, huffman=True).encode(FRAMES)
+    assert len(coded) < len(plain)
+    np.testing.assert_array_equal(IntraFrameCodec(75).decode(coded), IntraFrameCodec(75).decode(plain))
+
+
+def test_single_frame_round_trip():
+    codec = IntraFrameCodec(75)
+    assert codec.decode(codec.encode(FRAMES[0])).shape == FRAMES[0].shape
+
+
+@pytest.mark.parametrize('huffman', [False, True])
+def test_frame_costs(huffman):
+    # a flat frame next to a textured one
+    frames = np.stack([np.full_like(FRAMES[0], 128), FRAMES[0]])
+    bitstream = IntraFrameCodec(75, huffman=huffman).encode(frames)
+    costs = frame_costs(bitstream)
+    assert len(costs) == 2
+    assert costs[0] < costs[1]
+    table = HUFFMAN_SYMBOLS if struct.unpack_from(HEADER_FORMAT, bitstream)[4] & FLAG_HUFFMAN else 0
+    assert HEADER_SIZE + table + sum(costs) == len(bitstream)
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from P1_video.main import DCTConverter
+from P1_video.parallel import StripeExecutor
+
+
+@pytest.fixture(scope='module')
+def executor():
+    with StripeExecutor(workers=2) as executor:
+        yield executor
+
+
+def test_dct_encode_frame_matches_single_process(executor):
+    frame = np.random.default_rng(0).random((37, 50))
+    expected = DCTConverter(batched=True).encode(frame)
+    np.testing.assert_allclose(executor.dct_encode(frame), expected)
+
+
+def test_dct_encode_stack_matches_single_process(executor):
+    stack = np.random.default_rng(1).random((2, 3, 20, 30)).astype(np.float32)
+    expected = DCTConverter(batched=True, dtype=np.float32).encode(stack)
+    result = executor.dct_encode(stack, dtype=np.float32)
+    assert result.shape == (2, 3, 24, 32)
+    np.testing.assert_allclose(result, expected, rtol=1e-5, atol=1e-5)
+
+
+def test_dct_decode_stack_round_trip(executor):
+    stack = np.random.default_rng(2).random((5, 16, 24))
+    decoded = executor.dct_decode(executor.dct_encode(stack))
+    np.testing.assert_allclose(decoded, stack, atol=1e-9)
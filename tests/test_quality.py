@@ -0,0 +1,28 @@
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from SP3.SP3_video.quality import compare_videos, ssim
+
+
+def test_identical_planes():
+    plane = np.random.default_rng(0).integers(0, 256, (3, 30, 44))
+    np.testing.assert_allclose(ssim(plane, plane), 1.0)
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="needs ffmpeg")
+def test_ssim_matches_ffmpeg(tmp_path):
+    source, encode, stats = (str(tmp_path / name) for name in ('source.mkv', 'encode.mp4', 'ssim.log'))
+    # not a multiple of 8, so the edges left out have to be the same too
+    subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc2=size=174x98:duration=1',
+                    '-pix_fmt', 'yuv420p', '-c:v', 'ffv1', source], check=True)
+    subprocess.run(['ffmpeg', '-v', 'error', '-i', source, '-c:v', 'libx264', '-crf', '40', encode], check=True)
+    subprocess.run(['ffmpeg', '-v', 'error', '-i', source, '-i', encode,
+                    '-lavfi', f'ssim=stats_file={stats}', '-f', 'null', '-'], check=True)
+    with open(stats) as f:
+        expected = [[float(field.split(':')[1]) for field in line.split()[1:4]] for line in f]
+
+    result = compare_videos(source, {'x264': encode}, width=174, height=98)['x264']
+    np.testing.assert_allclose(result['ssim'], expected, atol=1e-5)
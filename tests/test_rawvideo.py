@@ -0,0 +1,31 @@
+import shutil
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from P1_video.rawvideo import read_frames
+
+pytestmark = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="needs ffmpeg")
+
+
+def test_verbose_ffmpeg_does_not_block(tmp_path):
+    # ffmpeg logging far more than a pipe buffer holds while the frames stream
+    script = textwrap.dedent(f"""
+        import numpy as np
+        from P1_video.rawvideo import read_frames, FrameWriter
+        frames = read_frames('testsrc=size=32x32:duration=40:rate=25', 32, 32,
+                             input_args=['-loglevel', 'debug', '-f', 'lavfi'])
+        assert sum(1 for _ in frames) == 1000
+        with FrameWriter({str(tmp_path / 'out.mkv')!r}, 32, 32, ['-loglevel', 'debug', '-c:v', 'ffv1']) as writer:
+            for _ in range(500):
+                writer.write(np.zeros((32, 32, 3), np.uint8))
+    """)
+    subprocess.run([sys.executable, '-c', script], check=True, timeout=60)
+
+
+def test_errors_are_reported(tmp_path):
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        list(read_frames(str(tmp_path / 'missing.mp4'), 32, 32))
+    assert b'No such file' in error.value.stderr
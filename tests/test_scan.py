@@ -0,0 +1,15 @@
+import numpy as np
+
+from P1_video.main import serpentine_order, serpentine_scan
+
+
+def test_serpentine_scan():
+    assert serpentine_scan(bytes(range(12)), 4, 3).tolist() == [0, 1, 2, 3, 7, 6, 5, 4, 8, 9, 10, 11]
+
+
+def test_serpentine_order_is_compact_and_shared():
+    order = serpentine_order(64, 48)
+    assert order.dtype == np.uint32
+    assert not order.flags.writeable
+    assert serpentine_order(64, 48) is order
+    assert serpentine_order.cache_info().maxsize <= 8